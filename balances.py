@@ -0,0 +1,99 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List
+
+from cache import cache_backend
+from tron_client import USDT_CONTRACT, AsyncTronNodePool, is_base58check_address
+
+# Configuration
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "5"))
+BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", "10000"))
+BALANCE_BATCH_CONCURRENCY = int(os.getenv("BALANCE_BATCH_CONCURRENCY", "10"))
+
+
+class BalanceLookupError(Exception):
+    """Raised when one or more token balances could not be fetched.
+
+    ``balances`` carries what was fetched, with failed tokens reported as 0.
+    """
+
+    def __init__(self, address: str, balances: dict, errors: List[Exception]):
+        super().__init__("; ".join(str(e) or type(e).__name__ for e in errors))
+        self.address = address
+        self.balances = balances
+        self.errors = errors
+
+
+class BalanceService:
+    """TRX + USDT-TRC20 balance lookups behind a short per-address TTL cache (shared if ``CACHE_URL`` is set)."""
+
+    def __init__(self, tron: AsyncTronNodePool, ttl: float = BALANCE_CACHE_TTL, maxsize: int = BALANCE_CACHE_SIZE):
+        self.tron = tron
+        self.cache = cache_backend("balances", maxsize=maxsize, ttl=ttl)
+
+    async def _trx_balance(self, address: str):
+        from tronpy.exceptions import AddressNotFound
+
+        try:
+            # tronpy returns a Decimal; cached values stay plain JSON for the shared backend.
+            return float(await self.tron.call(lambda client: client.get_account_balance(address), method="get_account_balance"))
+        except AddressNotFound:
+            # Never-activated accounts simply hold nothing.
+            return 0
+
+    async def _usdt_balance(self, address: str):
+        async def balance_of(client):
+            contract = await self.tron.get_contract(client, USDT_CONTRACT)
+            return await contract.functions.balanceOf(address)
+
+        return await self.tron.call(balance_of, method="balanceOf") / 1_000_000
+
+    async def _fetch(self, address: str) -> dict:
+        results = await asyncio.gather(
+            self._trx_balance(address),
+            self._usdt_balance(address),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        trx_balance, usdt_balance = [0 if isinstance(r, Exception) else r for r in results]
+        balances = {
+            "TRX": trx_balance,
+            "USDT": usdt_balance,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        if errors:
+            # Partial results are returned to the caller but never cached.
+            raise BalanceLookupError(address, balances, errors)
+        return balances
+
+    async def get(self, address: str) -> Dict:
+        """Balances for ``address``, served from cache when fresh."""
+        return await self.cache.get_or_load(address, lambda: self._fetch(address))
+
+    async def get_many(self, addresses: List[str], concurrency: int = BALANCE_BATCH_CONCURRENCY) -> List[Dict]:
+        """Balances for many addresses with at most ``concurrency`` node lookups in flight.
+
+        Each item is either ``{"address", "balances", "updated_at"}`` or
+        ``{"address", "error"}``; one bad address never fails the batch.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(address: str) -> Dict:
+            if not is_base58check_address(address):
+                return {"address": address, "error": "Invalid TRON address"}
+            try:
+                async with semaphore:
+                    result = await self.get(address)
+            except Exception as e:
+                return {"address": address, "error": str(e) or type(e).__name__}
+            return {
+                "address": address,
+                "balances": {"TRX": result["TRX"], "USDT": result["USDT"]},
+                "updated_at": result["updated_at"],
+            }
+
+        return await asyncio.gather(*(one(address) for address in addresses))
+
+    async def invalidate(self, address: str):
+        await self.cache.delete(address)
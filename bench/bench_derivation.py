@@ -0,0 +1,49 @@
+"""Wallet key generation: random keys vs. HD derivation from a cached account node.
+
+    python bench/bench_derivation.py [--wallets 2000]
+
+"random" is the ``WALLET_DERIVATION=random`` path (``PrivateKey.random()`` per
+wallet); "hd, full path" derives ``m/44'/195'/0'/0/i`` from the seed for every
+wallet with tronpy; "hd, cached account node" is what ``/wallets/create`` and
+``/wallets/batch`` do. Each includes computing the address.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from tronpy.hdwallet import key_from_seed  # noqa: E402
+from tronpy.keys import PrivateKey  # noqa: E402
+
+from derivation import HD_ACCOUNT_PATH, account_node, derive_accounts, new_seed, random_accounts  # noqa: E402
+
+
+def run(label, wallets, create):
+    start = time.perf_counter()
+    create()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {wallets / elapsed:>10,.0f} wallets/s  {elapsed / wallets * 1e6:>8.1f} us/wallet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=2000)
+    args = parser.parse_args()
+
+    seed = new_seed()
+
+    def full_path():
+        for i in range(args.wallets):
+            PrivateKey(key_from_seed(seed, f"{HD_ACCOUNT_PATH}/{i}")).public_key.to_base58check_address()
+
+    print(f"{args.wallets} wallets")
+    run("random", args.wallets, lambda: random_accounts(args.wallets))
+    run("hd, full path", args.wallets, full_path)
+    run("hd, cached account node", args.wallets, lambda: derive_accounts(account_node(seed), 0, args.wallets))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Signing throughput with plaintext keys vs. envelope-encrypted keys (with and without the key cache).
+
+    python bench/bench_signing.py [--signs 5000] [--wallets 100]
+
+Each sign mimics the send path: turn the stored ``Wallet.private_key`` value
+into a ``PrivateKey`` and sign a transaction hash with it.
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tronpy.keys import PrivateKey  # noqa: E402
+
+from keystore import KeyStore, PrivateKeyCache  # noqa: E402
+
+
+def run(label, signs, sign_one):
+    start = time.perf_counter()
+    for i in range(signs):
+        sign_one(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {signs / elapsed:>10,.0f} signs/s  {elapsed / signs * 1e6:>8.1f} us/sign")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signs", type=int, default=5000)
+    parser.add_argument("--wallets", type=int, default=100)
+    args = parser.parse_args()
+
+    keystore = KeyStore({"k1": secrets.token_bytes(32)}, "k1")
+    wallets = []
+    for _ in range(args.wallets):
+        key = PrivateKey.random()
+        address = key.public_key.to_base58check_address()
+        wallets.append((address, key.hex(), keystore.encrypt(key.hex(), address)))
+    txid = secrets.token_bytes(32)
+
+    def plaintext(i):
+        _, hex_key, _ = wallets[i % len(wallets)]
+        PrivateKey(bytes.fromhex(hex_key)).sign_msg_hash(txid)
+
+    def encrypted(i):
+        address, _, stored = wallets[i % len(wallets)]
+        PrivateKey(bytes.fromhex(keystore.decrypt(stored, address).decode())).sign_msg_hash(txid)
+
+    cache = PrivateKeyCache(maxsize=args.wallets, ttl=60)
+
+    def encrypted_cached(i):
+        address, _, stored = wallets[i % len(wallets)]
+        load = lambda: bytes.fromhex(keystore.decrypt(stored, address).decode())  # noqa: E731
+        with cache.borrow((address, stored), load) as key:
+            key.sign_msg_hash(txid)
+
+    print(f"{args.signs} signs over {args.wallets} wallets")
+    run("plaintext hex", args.signs, plaintext)
+    run("encrypted, decrypt every sign", args.signs, encrypted)
+    run("encrypted, key cache", args.signs, encrypted_cached)
+    print(f"key cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
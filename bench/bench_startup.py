@@ -0,0 +1,80 @@
+"""Cold-start time of the API: ``import main``, lifespan startup and the first ``/health``.
+
+    python bench/bench_startup.py [--runs 5] [--top 15]
+
+Each run is a fresh interpreter, as on a new worker or deploy. ``--top`` lists
+the slowest modules from ``python -X importtime`` for one extra run. Needs the
+same environment as the app (``DATABASE_URL``, ``SESSION_SECRET``).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def run():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            resp = await client.get("/health")
+            resp.raise_for_status()
+        t3 = time.perf_counter()
+    heavy = [m for m in ("tronpy", "faker", "qrcode", "PIL", "passlib") if m in sys.modules]
+    print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first_health": t3 - t2, "loaded": heavy}))
+
+asyncio.run(run())
+"""
+
+
+def probe() -> dict:
+    env = {"WATCHER_ENABLED": "false", **os.environ}
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def top_imports(n: int):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Direct imports of main only (three spaces of indent), so nested modules are not counted twice.
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(cumulative_us), name.strip()))
+    print("\nslowest imports from main")
+    for cumulative_us, name in sorted(rows, reverse=True)[:n]:
+        print(f"  {name:<28} {cumulative_us / 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    print(f"{args.runs} cold starts (median)")
+    for key in ("import", "startup", "first_health"):
+        print(f"  {key:<14} {statistics.median(r[key] for r in results) * 1000:>8.1f} ms")
+    total = statistics.median(r["import"] + r["startup"] + r["first_health"] for r in results)
+    print(f"  {'total':<14} {total * 1000:>8.1f} ms")
+    print(f"  heavy modules loaded: {', '.join(results[-1]['loaded']) or 'none'}")
+
+    if args.top:
+        top_imports(args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Check that PasswordHasher falls back to threads exactly once when its process pool breaks.
+
+    python bench/check_hasher_fallback.py [--calls 8]
+
+Queues ``--calls`` bcrypt hashes on a process pool next to one call that kills
+its pool worker. Every call in flight sees ``BrokenProcessPool``; all of them
+must still return a hash, exactly one thread pool must replace the broken
+process pool, and the broken pool must be shut down. Exits non-zero on the
+first failed check.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from hashing import PasswordHasher, hash_secret  # noqa: E402
+
+
+def crash_pool_worker(secret: str) -> str:
+    # Kills a pool worker; when retried on the fallback threads it just hashes.
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return hash_secret(secret)
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        sys.exit(1)
+
+
+async def run(calls: int):
+    hasher = PasswordHasher(workers=2, concurrency=calls + 1, executor="process")
+    check(hasher.kind == "process", "hasher starts on a process pool")
+    broken_pool = hasher._executor
+    created = []
+    create_executor = hasher._create_executor
+
+    def counting_create_executor(kind: str):
+        executor = create_executor(kind)
+        created.append(executor)
+        return executor
+
+    hasher._create_executor = counting_create_executor
+    try:
+        results = await asyncio.gather(
+            hasher._run(crash_pool_worker, "crash"),
+            *(hasher.hash(f"secret-{i}") for i in range(calls)),
+        )
+        check(all(result.startswith("$2") for result in results), f"all {calls + 1} calls returned a hash")
+        check(len(created) == 1, f"exactly one fallback pool created (got {len(created)})")
+        check(hasher.kind == "thread" and hasher._executor is created[0], "hasher now runs on the fallback threads")
+        check(broken_pool._shutdown_thread, "broken process pool was shut down")
+    finally:
+        hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=8, help="hashes in flight when the pool breaks")
+    args = parser.parse_args()
+    asyncio.run(run(args.calls))
+
+
+if __name__ == "__main__":
+    main()
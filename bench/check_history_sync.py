@@ -0,0 +1,71 @@
+"""Check that /transactions serves the newest transfers of an address with a long history.
+
+    python bench/check_history_sync.py [--history 1500]
+
+Runs the API against ``bench/fake_tron.py`` with ``--history`` transfers per token,
+more than one sync fetches (``TX_SYNC_MAX_PAGES`` x ``TX_SYNC_PAGE_SIZE``). The first
+page must start with the newest transfer right away, report ``synced: false`` while
+older history is backfilled, and, once ``synced`` turns true, paging through must
+return every transfer exactly once. Exits non-zero on the first failed check.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import api_server, database, fake_tron_node  # noqa: E402
+
+ADDRESS = "TCLBgkbfVkJroVBJVqBEsxtPNQEQMTQCLQ"
+# fake_tron.py's first transfer; one per token every minute after it.
+FIRST_TIMESTAMP = "2023-11-14T22:13:20"
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        sys.exit(1)
+
+
+def run(url: str, history: int):
+    newest = (datetime.fromisoformat(FIRST_TIMESTAMP) + timedelta(minutes=history - 1)).isoformat()
+    with httpx.Client(base_url=url, timeout=60) as client:
+        page = client.get(f"/transactions/{ADDRESS}", params={"limit": 2}).json()
+        check(page["transactions"][0]["timestamp"] == newest, f"first page starts at the newest transfer ({newest})")
+        check(page["synced"] is False, "first sync reports the backlog")
+
+        for syncs in range(2, 20):
+            if client.get(f"/transactions/{ADDRESS}", params={"limit": 2}).json()["synced"]:
+                break
+        else:
+            check(False, "backlog is filled")
+        print(f"     synced after {syncs} first-page requests")
+
+        txids, cursor = [], None
+        while True:
+            params = {"limit": 200, **({"cursor": cursor} if cursor else {})}
+            page = client.get(f"/transactions/{ADDRESS}", params=params).json()
+            txids.extend(tx["txid"] for tx in page["transactions"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        check(len(txids) == 2 * history, f"all {2 * history} transfers stored (got {len(txids)})")
+        check(len(set(txids)) == len(txids), "no transfer stored twice")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=1500, help="transfers per token on the fake node")
+    args = parser.parse_args()
+
+    with database("sqlite") as database_url, \
+            fake_tron_node(1, env={"FAKE_TRON_HISTORY_SIZE": str(args.history)}) as node_url, \
+            api_server(database_url, node_url) as url:
+        run(url, args.history)
+
+
+if __name__ == "__main__":
+    main()
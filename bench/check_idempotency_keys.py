@@ -0,0 +1,66 @@
+"""Check that Idempotency-Keys of POST /send and POST /send/batch never collide.
+
+    python bench/check_idempotency_keys.py
+
+Runs the API against ``bench/fake_tron.py``, sends a batch under key ``abc`` and
+then single transfers under the keys its items would have used before batch items
+got their own namespace (``abc:0``) and under the batch namespace itself. The
+single transfer must create a new job, a key inside the batch namespace must be
+rejected, and replaying the batch must still return its original jobs. Exits
+non-zero on the first failed check.
+"""
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import api_server, database, fake_tron_node  # noqa: E402
+
+RECIPIENT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        sys.exit(1)
+
+
+def run(url: str):
+    with httpx.Client(base_url=url, timeout=60) as client:
+        resp = client.post("/auth/register", json={"pin": f"idem{time.time_ns()}", "password": "bench-password"})
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        wallet = client.post("/wallets/create", json={"name": "bench"}, headers=headers).json()["address"]
+
+        batch = {"from_address": wallet, "transfers": [
+            {"to_address": RECIPIENT, "amount": 1, "token_type": "TRX"},
+            {"to_address": RECIPIENT, "amount": 2, "token_type": "TRX"},
+        ]}
+        first = client.post("/send/batch", json=batch, headers={**headers, "Idempotency-Key": "abc"})
+        check(first.status_code == 200, f"batch under key 'abc' accepted ({first.status_code})")
+        batch_jobs = [item["job_id"] for item in first.json()["results"]]
+
+        single = {"from_address": wallet, "to_address": RECIPIENT, "amount": 1, "token_type": "TRX"}
+        resp = client.post("/send", json=single, headers={**headers, "Idempotency-Key": "abc:0"})
+        check(resp.status_code in (200, 202), f"single transfer under key 'abc:0' accepted ({resp.status_code})")
+        check(resp.json()["job_id"] not in batch_jobs, "single transfer under 'abc:0' is a new job, not batch item 0")
+
+        resp = client.post("/send", json=single, headers={**headers, "Idempotency-Key": "batch:abc:0"})
+        check(resp.status_code == 400, f"single transfer under key 'batch:abc:0' rejected ({resp.status_code})")
+
+        replay = client.post("/send/batch", json=batch, headers={**headers, "Idempotency-Key": "abc"})
+        check(
+            [item["job_id"] for item in replay.json()["results"]] == batch_jobs,
+            "replayed batch returns its original jobs",
+        )
+
+
+def main():
+    with database("sqlite") as database_url, fake_tron_node(1) as node_url, api_server(database_url, node_url) as url:
+        run(url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Local stand-in for a TRON full node (plus the TronGrid ``/v1`` history API) for benchmarks.
+
+    python bench/fake_tron.py [--port 18090] [--latency 50] [--jitter 20] [--error-rate 0]
+
+Answers the calls the API makes (``getaccount``, ``triggerconstantcontract``,
+``broadcasttransaction``, block and receipt lookups, ...) with canned data after
+a configurable delay, so load tests measure the API rather than a public node's
+rate limits. Point the API at it with ``TRON_NODE_URLS=http://127.0.0.1:18090``.
+
+``POST /control`` with a JSON object updates the settings at runtime, e.g.
+``{"latency_ms": 200}`` or ``{"fail_broadcasts": 3}`` (the next 3 broadcasts get a 503).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+USDT_ABI = {"entrys": [
+    {"name": "balanceOf", "type": "Function", "stateMutability": "View",
+     "inputs": [{"name": "who", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+    {"name": "transfer", "type": "Function", "stateMutability": "Nonpayable",
+     "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}],
+     "outputs": [{"name": "", "type": "bool"}]},
+]}
+COUNTERPARTY = "TXYZopYRdj2D9XRtbG411XZZ3kM5VkAeBf"
+# Transfers per token per address in the history API (two tokens, so twice this in /transactions).
+HISTORY_SIZE = int(os.getenv("FAKE_TRON_HISTORY_SIZE", "100"))
+
+SETTINGS = {
+    "latency_ms": float(os.getenv("FAKE_TRON_LATENCY_MS", "20")),
+    "jitter_ms": float(os.getenv("FAKE_TRON_JITTER_MS", "0")),
+    # Share of calls answered with a 503, to exercise failover and retries.
+    "error_rate": float(os.getenv("FAKE_TRON_ERROR_RATE", "0")),
+    "fail_broadcasts": 0,
+}
+STATE = {"block": 1000, "txs": {}, "calls": {}}
+
+
+async def _delay(method: str):
+    STATE["calls"][method] = STATE["calls"].get(method, 0) + 1
+    latency = SETTINGS["latency_ms"] + random.uniform(0, SETTINGS["jitter_ms"])
+    await asyncio.sleep(latency / 1000)
+    return random.random() < SETTINGS["error_rate"]
+
+
+def _block_id(number: int, filler: str) -> str:
+    return format(number, "016x") + filler * 24
+
+
+def _wallet_method(method: str, body: dict) -> dict:
+    if method == "getaccount":
+        return {"address": body.get("address"), "balance": 12_345_678}
+    if method == "getaccountresource":
+        return {"freeNetLimit": 600, "freeNetUsed": 0, "EnergyLimit": 0, "EnergyUsed": 0}
+    if method == "getcontract":
+        return {"contract_address": body.get("value"), "abi": USDT_ABI, "name": "TetherToken"}
+    if method == "triggerconstantcontract":
+        if body.get("function_selector", "").startswith("balanceOf"):
+            return {"result": {"result": True}, "constant_result": [format(5_000_000, "064x")], "energy_used": 900}
+        return {"result": {"result": True}, "constant_result": [format(1, "064x")], "energy_used": 14_650}
+    if method == "getchainparameters":
+        return {"chainParameter": [{"key": "getEnergyFee", "value": 420}, {"key": "getTransactionFee", "value": 1000}]}
+    if method == "getnodeinfo":
+        block_id = _block_id(STATE["block"], "ab")
+        return {"block": f"Num:{STATE['block']},ID:{block_id}", "solidityBlock": f"Num:{STATE['block']},ID:{block_id}"}
+    if method in ("getnowblock", "getblockbynum"):
+        number = body.get("num", STATE["block"])
+        return {
+            "blockID": _block_id(number, "cd"),
+            "block_header": {"raw_data": {"number": number, "timestamp": int(time.time() * 1000)}},
+            "transactions": [],
+        }
+    if method == "getsignweight":
+        txid = hashlib.sha256(json.dumps(body.get("raw_data"), sort_keys=True).encode()).hexdigest()
+        return {"transaction": {"transaction": {"txID": txid}}, "permission": None}
+    if method == "broadcasttransaction":
+        txid = body["txID"]
+        if txid in STATE["txs"]:
+            return {"code": "DUP_TRANSACTION_ERROR", "message": "647570"}
+        STATE["txs"][txid] = time.time()
+        return {"result": True, "txid": txid}
+    if method == "gettransactioninfobyid":
+        if body.get("value") in STATE["txs"]:
+            return {"id": body["value"], "blockNumber": STATE["block"], "receipt": {"result": "SUCCESS"}}
+        return {}
+    return {"Error": f"unsupported method {method}"}
+
+
+async def wallet(request: Request):
+    method = request.path_params["method"]
+    failed = await _delay(method)
+    if method == "broadcasttransaction" and SETTINGS["fail_broadcasts"] > 0:
+        SETTINGS["fail_broadcasts"] -= 1
+        failed = True
+    if failed:
+        return JSONResponse({"Error": "node busy"}, status_code=503)
+    try:
+        body = await request.json()
+    except ClientDisconnect:
+        # The API process was stopped mid-call (end of a benchmark run).
+        return Response(status_code=499)
+    except ValueError:
+        body = {}
+    return JSONResponse(_wallet_method(method, body))
+
+
+def _history(address: str, trc20: bool) -> list:
+    base = 1_700_000_000_000
+    rows = []
+    for i in range(HISTORY_SIZE):
+        timestamp = base + i * 60_000
+        if trc20:
+            rows.append({
+                "transaction_id": hashlib.sha256(f"u{address}{i}".encode()).hexdigest(),
+                "block_timestamp": timestamp, "from": COUNTERPARTY, "to": address,
+                "type": "Transfer", "value": str(1_000_000 * (i + 1)),
+            })
+        else:
+            rows.append({
+                "txID": hashlib.sha256(f"t{address}{i}".encode()).hexdigest(),
+                "blockNumber": 900 + i, "block_timestamp": timestamp, "ret": [{"contractRet": "SUCCESS"}],
+                "raw_data": {"contract": [{"type": "TransferContract", "parameter": {"value": {
+                    "owner_address": address, "to_address": COUNTERPARTY, "amount": 2_000_000}}}]},
+            })
+    return rows
+
+
+async def account_transactions(request: Request):
+    trc20 = request.url.path.endswith("trc20")
+    if await _delay("v1/trc20" if trc20 else "v1/transactions"):
+        return JSONResponse({"success": False}, status_code=503)
+    params = request.query_params
+    rows = [
+        tx for tx in _history(request.path_params["address"], trc20)
+        if int(params.get("min_timestamp", 0)) <= tx["block_timestamp"] <= int(params.get("max_timestamp", 2**63))
+    ]
+    if params.get("order_by", "").endswith("desc"):
+        rows.reverse()
+    limit, offset = int(params.get("limit", 20)), int(params.get("fingerprint", 0))
+    page = rows[offset:offset + limit]
+    meta = {"at": int(time.time() * 1000), "page_size": len(page)}
+    if offset + limit < len(rows):
+        meta["fingerprint"] = str(offset + limit)
+    return JSONResponse({"data": page, "success": True, "meta": meta})
+
+
+async def control(request: Request):
+    if request.method == "POST":
+        SETTINGS.update(await request.json())
+    return JSONResponse({"settings": SETTINGS, "calls": STATE["calls"], "transactions": len(STATE["txs"])})
+
+
+app = Starlette(routes=[
+    Route("/control", control, methods=["GET", "POST"]),
+    Route("/wallet/{method}", wallet, methods=["POST"]),
+    Route("/walletsolidity/{method}", wallet, methods=["POST"]),
+    Route("/v1/accounts/{address}/transactions", account_transactions),
+    Route("/v1/accounts/{address}/transactions/trc20", account_transactions),
+])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--latency", type=float, default=SETTINGS["latency_ms"], help="base latency per call (ms)")
+    parser.add_argument("--jitter", type=float, default=SETTINGS["jitter_ms"], help="extra random latency, 0..N ms")
+    parser.add_argument("--error-rate", type=float, default=SETTINGS["error_rate"], help="share of calls answered with 503")
+    args = parser.parse_args()
+
+    SETTINGS.update(latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
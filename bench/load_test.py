@@ -0,0 +1,196 @@
+"""HTTP load test: throughput and p50/p99 latency per endpoint and concurrency level.
+
+    python bench/load_test.py [--db sqlite|postgres] [--concurrency 1,10,50] [--duration 10]
+                              [--scenarios login,wallets,balance,send,qr,history,export] [--node-latency 20]
+                              [--workers 1] [--users 20] [--url http://host:port]
+
+Starts a fake TRON node (``bench/fake_tron.py``), a fresh migrated database
+(``bench/fixtures.py``) and the API under uvicorn, seeds users with one wallet
+each, then runs every scenario at every concurrency level for ``--duration``
+seconds with that many clients looping back to back. With ``--url`` an already
+running API is targeted instead (it needs its own node and database).
+
+Run it before and after a change with the same arguments; ``--json`` writes the
+results for diffing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tron import COUNTERPARTY  # noqa: E402
+from fixtures import api_server, database, fake_tron_node  # noqa: E402
+
+SCENARIOS = ("login", "wallets", "balance", "send", "qr", "history", "export")
+
+
+class User:
+    def __init__(self, pin: str, password: str, token: str, address: str):
+        self.pin = pin
+        self.password = password
+        self.token = token
+        self.address = address
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def seed(client: httpx.AsyncClient, count: int) -> List[User]:
+    run_id = uuid.uuid4().hex[:8]
+
+    async def create(i: int) -> User:
+        pin, password = f"bench-{run_id}-{i}", f"password-{i}"
+        resp = await client.post("/auth/register", json={"pin": pin, "password": password})
+        resp.raise_for_status()
+        token = resp.json()["access_token"]
+        resp = await client.post("/wallets/create", json={"name": "bench"}, headers={"Authorization": f"Bearer {token}"})
+        resp.raise_for_status()
+        return User(pin, password, token, resp.json()["address"])
+
+    # Registration hashes two bcrypt secrets per user; keep the burst modest.
+    semaphore = asyncio.Semaphore(8)
+
+    async def limited(i: int) -> User:
+        async with semaphore:
+            return await create(i)
+
+    return await asyncio.gather(*(limited(i) for i in range(count)))
+
+
+def request_for(scenario: str, users: List[User]) -> Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]:
+    def pick() -> User:
+        return random.choice(users)
+
+    if scenario == "login":
+        async def call(client):
+            user = pick()
+            return await client.post("/auth/login", json={"pin": user.pin, "password": user.password})
+    elif scenario == "wallets":
+        async def call(client):
+            return await client.get("/wallets", headers=pick().headers)
+    elif scenario == "balance":
+        async def call(client):
+            return await client.get(f"/balance/{pick().address}")
+    elif scenario == "send":
+        async def call(client):
+            user = pick()
+            headers = {**user.headers, "Idempotency-Key": uuid.uuid4().hex}
+            body = {"from_address": user.address, "to_address": COUNTERPARTY, "amount": 0.000001, "token_type": "TRX"}
+            return await client.post("/send", json=body, headers=headers)
+    elif scenario == "qr":
+        async def call(client):
+            return await client.get(f"/qr/{pick().address}", params={"format": "png"})
+    elif scenario == "history":
+        async def call(client):
+            return await client.get(f"/transactions/{pick().address}", params={"limit": 200})
+    elif scenario == "export":
+        async def call(client):
+            return await client.get(f"/transactions/{pick().address}/export", params={"format": "csv"})
+    else:
+        raise ValueError(f"Unknown scenario '{scenario}'")
+    return call
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_level(client: httpx.AsyncClient, call, concurrency: int, duration: float) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = await call(client)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(url: str, args) -> List[Dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        users = await seed(client, args.users)
+        results = []
+        print(f"{'scenario':<10} {'conc':>5} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for scenario in args.scenarios:
+            call = request_for(scenario, users)
+            for concurrency in args.concurrency:
+                result = {"scenario": scenario, **await run_level(client, call, concurrency, args.duration)}
+                results.append(result)
+                print(
+                    f"{scenario:<10} {concurrency:>5} {result['requests']:>9} {result['errors']:>7} "
+                    f"{result['rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}",
+                    flush=True,
+                )
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--concurrency", default="1,10,50", help="comma separated client counts")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario and level")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20, help="seeded users, one wallet each")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--node-latency", type=float, default=20, help="fake node latency per call (ms)")
+    parser.add_argument("--node-jitter", type=float, default=0, help="extra random node latency, 0..N ms")
+    parser.add_argument("--url", help="target a running API instead of starting one")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario '{scenario}' (choose from {', '.join(SCENARIOS)})")
+
+    if args.url:
+        results = asyncio.run(run(args.url, args))
+    else:
+        with database(args.db) as database_url, \
+                fake_tron_node(args.node_latency, args.node_jitter) as node_url, \
+                api_server(database_url, node_url, workers=args.workers) as url:
+            print(f"db={args.db} workers={args.workers} node latency={args.node_latency:g}ms "
+                  f"duration={args.duration:g}s per level")
+            results = asyncio.run(run(url, args))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional
+
+import orjson
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Redis (or any server speaking its protocol, e.g. Valkey, KeyDB) shared by all workers,
+# e.g. redis://localhost:6379/0. Unset: every worker process keeps its own caches.
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "tron_wallet")
+# Seconds to wait for the cache server before treating a lookup as a miss
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "0.5"))
+
+_MISSING = object()
+
+
+class CacheUnavailable(Exception):
+    """The shared cache server could not be reached."""
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL.
+
+    ``get_or_load`` merges concurrent misses for the same key into a single
+    load, so a burst of requests for one key costs one upstream call.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = future
+        # Shielded so one cancelled caller does not abort the load the others wait on.
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ByteLRUCache:
+    """LRU cache of ``bytes`` values bounded by their total size rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._data[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CacheBackend(ABC):
+    """Async key/value cache with per-entry TTL, local or shared between processes.
+
+    Keys are strings and values must be JSON serialisable (None included) so any
+    backend can store them. ``get_or_load`` merges concurrent misses for the same
+    key within this process into a single load.
+    """
+
+    @abstractmethod
+    async def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class LocalCache(CacheBackend):
+    """:class:`TTLCache` behind the :class:`CacheBackend` interface; private to this process."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return self._cache.get(key, default)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def delete(self, key: str):
+        self._cache.pop(key)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        return await self._cache.get_or_load(key, loader)
+
+    def stats(self) -> dict:
+        return {"backend": "local", **self._cache.stats()}
+
+
+_redis_clients: Dict[str, "Redis"] = {}
+
+
+def _redis_class():
+    try:
+        from redis.asyncio import Redis
+    except ImportError as e:
+        raise RuntimeError("CACHE_URL is set but the 'redis' package is not installed") from e
+    return Redis
+
+
+def _redis_client(url: str) -> "Redis":
+    # Created on first use, so each (forked) worker opens its own connections.
+    client = _redis_clients.get(url)
+    if client is None:
+        client = _redis_class().from_url(url, socket_timeout=CACHE_TIMEOUT, socket_connect_timeout=CACHE_TIMEOUT)
+        _redis_clients[url] = client
+    return client
+
+
+async def close_shared_caches():
+    """Close this process's connections to the shared cache server."""
+    while _redis_clients:
+        _, client = _redis_clients.popitem()
+        await client.aclose()
+
+
+class RedisCache(CacheBackend):
+    """Entries under ``<CACHE_PREFIX>:<namespace>:<key>`` on a Redis-compatible server.
+
+    Every worker sees the same entries, so one worker's load or invalidation
+    serves all of them. If the server is unreachable ``get_or_load`` calls the
+    loader directly and ``delete`` gives up (the entry still expires with its
+    TTL); plain ``get`` and ``set`` raise :class:`CacheUnavailable`.
+    """
+
+    def __init__(self, url: str, namespace: str, ttl: float):
+        self.url = url
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _key(self, key: str) -> str:
+        return f"{CACHE_PREFIX}:{self.namespace}:{key}"
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        from redis.exceptions import RedisError
+
+        try:
+            raw = await _redis_client(self.url).get(self._key(key))
+        except (RedisError, OSError) as e:
+            raise CacheUnavailable(str(e)) from e
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return orjson.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        from redis.exceptions import RedisError
+
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            await _redis_client(self.url).set(self._key(key), orjson.dumps(value), px=max(int(ttl * 1000), 1))
+        except (RedisError, OSError) as e:
+            raise CacheUnavailable(str(e)) from e
+
+    async def delete(self, key: str):
+        from redis.exceptions import RedisError
+
+        try:
+            await _redis_client(self.url).delete(self._key(key))
+        except (RedisError, OSError) as e:
+            self._record_error("delete", e)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = future
+        # Shielded so one cancelled caller does not abort the load the others wait on.
+        return await asyncio.shield(future)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            try:
+                value = await self.get(key, _MISSING)
+            except CacheUnavailable as e:
+                self._record_error("read", e)
+                return await loader()
+            if value is not _MISSING:
+                return value
+            value = await loader()
+            try:
+                await self.set(key, value)
+            except CacheUnavailable as e:
+                self._record_error("write", e)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _record_error(self, action: str, error: Exception):
+        self.errors += 1
+        logger.warning("Shared cache %s failed for %s: %s", action, self.namespace, error)
+
+    def stats(self) -> dict:
+        # Size lives on the server and is shared; hits and misses are this worker's.
+        return {"backend": "redis", "size": None, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+# Take the lease if it is free, extend it if we already hold it.
+_LEASE_ACQUIRE = """
+local holder = redis.call('get', KEYS[1])
+if holder == false then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+if holder == ARGV[1] then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+_LEASE_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SharedLease:
+    """A named lease held by at most one process at a time, expiring ``ttl`` seconds after its last renewal.
+
+    The holder calls :meth:`acquire` at least once per ``ttl`` to keep it. Without
+    ``CACHE_URL`` there is nothing to share and every process holds its own lease.
+    If the cache server is unreachable :meth:`acquire` also reports the lease as
+    held, so each worker carries on alone rather than all of them stopping.
+    """
+
+    def __init__(self, name: str, ttl: float, url: Optional[str] = CACHE_URL):
+        self.url = url
+        self.key = f"{CACHE_PREFIX}:lease:{name}"
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.shared = bool(url)
+
+    async def acquire(self) -> bool:
+        if not self.url:
+            return True
+        from redis.exceptions import RedisError
+
+        try:
+            result = await _redis_client(self.url).eval(_LEASE_ACQUIRE, 1, self.key, self.owner, int(self.ttl * 1000))
+        except (RedisError, OSError) as e:
+            logger.warning("Shared cache unreachable, holding lease %s locally: %s", self.key, e)
+            self.shared = False
+            return True
+        self.shared = True
+        return bool(result)
+
+    async def release(self):
+        if not self.url:
+            return
+        from redis.exceptions import RedisError
+
+        try:
+            await _redis_client(self.url).eval(_LEASE_RELEASE, 1, self.key, self.owner)
+        except (RedisError, OSError) as e:
+            logger.warning("Could not release lease %s (it expires on its own): %s", self.key, e)
+
+
+class SharedChannel:
+    """Fan-out of JSON messages to every process subscribed to ``<CACHE_PREFIX>:<name>`` (Redis pub/sub).
+
+    Delivery is best effort: a process that is not listening when a message is
+    published never sees it.
+    """
+
+    def __init__(self, name: str, url: str = CACHE_URL):
+        self.url = url
+        self.channel = f"{CACHE_PREFIX}:{name}"
+
+    async def publish(self, message: Any) -> bool:
+        from redis.exceptions import RedisError
+
+        try:
+            await _redis_client(self.url).publish(self.channel, orjson.dumps(message))
+        except (RedisError, OSError) as e:
+            logger.warning("Could not publish to %s: %s", self.channel, e)
+            return False
+        return True
+
+    async def listen(self) -> AsyncIterator[Any]:
+        """Yield messages as they arrive; reconnects after a lost connection."""
+        from redis.exceptions import RedisError
+
+        while True:
+            # Own connection without a read timeout: a quiet channel is not an error.
+            client = _redis_class().from_url(self.url, socket_connect_timeout=CACHE_TIMEOUT)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        yield orjson.loads(message["data"])
+            except (RedisError, OSError) as e:
+                logger.warning("Lost subscription to %s, retrying: %s", self.channel, e)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+            await asyncio.sleep(1)
+
+
+def cache_backend(namespace: str, maxsize: int, ttl: float) -> CacheBackend:
+    """Shared :class:`RedisCache` when ``CACHE_URL`` is set, else a :class:`LocalCache`.
+
+    ``maxsize`` bounds only the local backend; the server evicts by its own policy.
+    """
+    if CACHE_URL:
+        return RedisCache(CACHE_URL, namespace, ttl)
+    return LocalCache(maxsize=maxsize, ttl=ttl)
@@ -1,7 +1,8 @@
 
 import os
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, DateTime, Float, Boolean, ForeignKey
+from sqlalchemy import create_engine, make_url, Column, String, Text, DateTime, Float, Boolean, ForeignKey, Index, Integer, BigInteger, UniqueConstraint
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
@@ -13,10 +14,62 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Create engine and session
-engine = create_engine(DATABASE_URL)
+# Connection pool settings. These are per process: with N uvicorn workers the database
+# sees up to N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# Recycle connections before Postgres/proxies drop them idle, so restarts don't surface stale sockets
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "10"))
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # Local development only; SQLite has no server-side pool to tune.
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+        },
+    }
+
+def _async_engine_args(url: str):
+    """Async driver URL (asyncpg / aiosqlite) and engine options for the same database."""
+    async_url = make_url(url)
+    if async_url.get_backend_name() == "sqlite":
+        return async_url.set(drivername="sqlite+aiosqlite"), {}
+
+    # asyncpg does not understand libpq's sslmode query parameter
+    connect_args = {
+        "timeout": DB_CONNECT_TIMEOUT,
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+    }
+    sslmode = async_url.query.get("sslmode")
+    if sslmode:
+        async_url = async_url.difference_update_query(["sslmode"])
+        if sslmode != "disable":
+            connect_args["ssl"] = sslmode
+    options = _engine_options(url)
+    options["connect_args"] = connect_args
+    return async_url.set(drivername="postgresql+asyncpg"), options
+
+# Create engine and session. The sync engine serves scripts and maintenance tasks;
+# the API handlers use the async engine so DB waits never block the event loop.
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_ASYNC_DATABASE_URL, _ASYNC_ENGINE_OPTIONS = _async_engine_args(DATABASE_URL)
+async_engine = create_async_engine(_ASYNC_DATABASE_URL, **_ASYNC_ENGINE_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Database Models
@@ -26,6 +79,9 @@ class User(Base):
     id = Column(String, primary_key=True, index=True)
     pin_hash = Column(String, nullable=False)
     password_hash = Column(String, nullable=True)
+    # HD seed (hex, encrypted like wallet keys) and the next child index to derive
+    hd_seed = Column(String, nullable=True)
+    hd_next_index = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     
     wallets = relationship("Wallet", back_populates="user", cascade="all, delete-orphan")
@@ -37,7 +93,8 @@ class Wallet(Base):
     user_id = Column(String, ForeignKey("app_users.id"), nullable=False)
     name = Column(String, nullable=False)
     address = Column(String, nullable=False, index=True)
-    private_key = Column(String, nullable=False)
+    private_key = Column(String, nullable=True)  # NULL for wallets derived from the user's HD seed
+    derivation_index = Column(Integer, nullable=True)
     hex_address = Column(String, nullable=True)
     gmail = Column(String, nullable=True)
     phone = Column(String, nullable=True)
@@ -47,6 +104,15 @@ class Wallet(Base):
     
     user = relationship("User", back_populates="wallets")
 
+    __table_args__ = (
+        # Serves the per-user, created_at-ordered keyset pagination of GET /wallets
+        Index("ix_app_wallets_user_id_created_at", "user_id", "created_at"),
+        # Serves the owned-wallet lookup in POST /send
+        Index("ix_app_wallets_user_id_address", "user_id", "address"),
+        # One wallet per derived key; NULL (random-key wallets) never collides
+        Index("ix_app_wallets_user_id_derivation_index", "user_id", "derivation_index", unique=True),
+    )
+
 class DemoProfile(Base):
     __tablename__ = "demo_profiles"
     
@@ -59,7 +125,77 @@ class DemoProfile(Base):
     balance_usdt = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-# Database dependency
+class Transaction(Base):
+    """A TRX or USDT-TRC20 transfer touching `address`, synced from the node."""
+    __tablename__ = "app_transactions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    address = Column(String, nullable=False)
+    txid = Column(String, nullable=False)
+    token = Column(String, nullable=False)  # "TRX" or "USDT"
+    direction = Column(String, nullable=False)  # "in" or "out"
+    from_address = Column(String, nullable=True)
+    to_address = Column(String, nullable=True)
+    amount = Column(BigInteger, nullable=False)  # smallest unit (sun / 10^-6 USDT)
+    block_number = Column(BigInteger, nullable=True)
+    block_timestamp = Column(DateTime, nullable=False)
+    status = Column(String, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("address", "txid", "token", name="uq_app_transactions_address_txid_token"),
+        # Newest-first keyset pagination per address
+        Index("ix_app_transactions_address_block_timestamp", "address", "block_timestamp", "id"),
+    )
+
+class TransactionSyncState(Base):
+    """How far each address's history has been synced, per token (ms block timestamps).
+
+    Everything from ``<token>_last_timestamp`` down is stored, except transfers
+    between ``<token>_gap_start`` and ``<token>_gap_end`` (inclusive) while those
+    are set: older history still being backfilled.
+    """
+    __tablename__ = "app_tx_sync_state"
+
+    address = Column(String, primary_key=True)
+    trx_last_timestamp = Column(BigInteger, nullable=False, default=0)
+    usdt_last_timestamp = Column(BigInteger, nullable=False, default=0)
+    trx_gap_start = Column(BigInteger, nullable=True)
+    trx_gap_end = Column(BigInteger, nullable=True)
+    usdt_gap_start = Column(BigInteger, nullable=True)
+    usdt_gap_end = Column(BigInteger, nullable=True)
+    synced_at = Column(DateTime, nullable=True)
+
+class SendJob(Base):
+    """A queued TRX/USDT transfer, from submission through broadcast to on-chain confirmation."""
+    __tablename__ = "app_send_jobs"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("app_users.id"), nullable=False)
+    idempotency_key = Column(String, nullable=True)
+    from_address = Column(String, nullable=False)
+    to_address = Column(String, nullable=False)
+    token = Column(String, nullable=False)  # "TRX" or "USDT"
+    amount = Column(BigInteger, nullable=False)  # smallest unit (sun / 10^-6 USDT)
+    # queued -> signed -> broadcasted -> confirmed, or failed at any step
+    status = Column(String, nullable=False, default="queued")
+    txid = Column(String, nullable=True)
+    signed_tx = Column(Text, nullable=True)  # kept so retries re-broadcast the exact same transaction
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    block_number = Column(BigInteger, nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # worker lease; also delays retries
+    locked_by = Column(String, nullable=True)  # token of the claim holding the lease
+    broadcast_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_app_send_jobs_user_id_idempotency_key"),
+        # Recovery and confirmation scans by status
+        Index("ix_app_send_jobs_status_updated_at", "status", "updated_at"),
+    )
+
+# Database dependencies
 def get_db():
     db = SessionLocal()
     try:
@@ -67,6 +203,27 @@ def get_db():
     finally:
         db.close()
 
-# Create tables
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _pool_stats(pool) -> dict:
+    status = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        stat = getattr(pool, name, None)
+        if callable(stat):
+            status[name] = stat()
+    if "size" in status:
+        status["max_overflow"] = DB_MAX_OVERFLOW
+    return status
+
+def pool_status() -> dict:
+    """Snapshot of the sync and async connection pools for health checks."""
+    return {
+        "async": _pool_stats(async_engine.pool),
+        "sync": _pool_stats(engine.pool),
+    }
+
+# Create tables directly (scripts/tests). Deployments use `python migrations.py`.
 def init_db():
     Base.metadata.create_all(bind=engine)
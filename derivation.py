@@ -0,0 +1,225 @@
+"""Hierarchical deterministic (BIP-32/44) wallet keys.
+
+Each user has one random seed, stored like a wallet key in ``User.hd_seed``
+(encrypted when ``WALLET_KEY_FILE`` is set, see :mod:`keystore`). Wallets are
+the children ``m/44'/195'/0'/0/<index>`` of that seed (TRON coin type 195), so
+HD wallets keep ``Wallet.private_key`` empty and the seed is the one secret to
+back up. The account node ``m/44'/195'/0'/0`` is cached per user in a zeroing
+:class:`keystore.PrivateKeyCache`; deriving a wallet from it costs one
+HMAC-SHA512 and two EC multiplications.
+
+``WALLET_DERIVATION=random`` keeps the previous behaviour of one random,
+separately stored key per wallet.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import User, Wallet
+from executor import run_blocking
+from keystore import KEY_CACHE_SIZE, KEY_CACHE_TTL, PrivateKeyCache, decrypt_private_key, encrypt_private_key, private_keys, seed_aad, signing_key
+
+if TYPE_CHECKING:
+    from tronpy.keys import PrivateKey
+
+# Configuration
+# "hd": derive new wallets from the user's seed; "random": one random key per wallet.
+WALLET_DERIVATION = os.getenv("WALLET_DERIVATION", "hd")
+HD_SEED_BYTES = 32
+HD_ACCOUNT_PATH = "m/44'/195'/0'/0"
+
+_HARDENED = 0x80000000
+_SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+# Highest non-hardened child index.
+MAX_INDEX = _HARDENED - 1
+
+
+class Account(NamedTuple):
+    address: str
+    hex_address: str
+    private_key: str  # hex
+    derivation_index: Optional[int]  # None for random keys
+
+
+class AccountNode(NamedTuple):
+    """Extended private key of ``HD_ACCOUNT_PATH``, plus its public point for soft children.
+
+    The secret halves are bytearrays so the cache can zero them in place.
+    """
+    key: bytearray
+    chain_code: bytearray
+    point: bytes
+
+
+class WalletKey(NamedTuple):
+    """What signing needs to know about a wallet's key, whichever way it is stored."""
+    user_id: str
+    address: str
+    private_key: Optional[str]  # stored Wallet.private_key; None for HD wallets
+    derivation_index: Optional[int]
+    hd_seed: Optional[str]  # stored User.hd_seed
+
+
+def new_seed() -> bytes:
+    return secrets.token_bytes(HD_SEED_BYTES)
+
+
+def _point(key: bytes) -> bytes:
+    from coincurve import PrivateKey as CoincurvePrivateKey
+
+    return CoincurvePrivateKey(key).public_key.format(compressed=True)
+
+
+def account_node(seed: bytes) -> AccountNode:
+    """Walk ``HD_ACCOUNT_PATH`` from the seed's master key."""
+    from tronpy.hdwallet.deterministic import Node, derive_child_key
+
+    master = hmac.new(b"Bitcoin seed", seed, hashlib.sha512).digest()
+    key, chain_code = master[:32], master[32:]
+    for node in HD_ACCOUNT_PATH.split("/")[1:]:
+        key, chain_code = derive_child_key(key, chain_code, Node.decode(node))
+    return AccountNode(bytearray(key), bytearray(chain_code), _point(key))
+
+
+def derive_key(node: AccountNode, index: int) -> bytes:
+    """Raw private key of the soft child ``index`` of ``node`` (BIP-32 CKDpriv)."""
+    if not 0 <= index <= MAX_INDEX:
+        raise ValueError(f"Derivation index {index} out of range")
+    digest = hmac.new(node.chain_code, node.point + index.to_bytes(4, "big"), hashlib.sha512).digest()
+    tweak = int.from_bytes(digest[:32], "big")
+    child = (tweak + int.from_bytes(node.key, "big")) % _SECP256K1_N
+    if tweak >= _SECP256K1_N or child == 0:
+        # Invalid child (probability < 2**-127); use the next index, as tronpy does.
+        return derive_key(node, index + 1)
+    return child.to_bytes(32, "big")
+
+
+def derive_accounts(node: AccountNode, start: int, count: int) -> List[Account]:
+    from tronpy.keys import PrivateKey
+
+    accounts = []
+    for index in range(start, start + count):
+        key = PrivateKey(derive_key(node, index))
+        accounts.append(Account(
+            key.public_key.to_base58check_address(), key.public_key.to_hex_address(), key.hex(), index
+        ))
+    return accounts
+
+
+def random_accounts(count: int) -> List[Account]:
+    from tronpy.keys import PrivateKey
+
+    accounts = []
+    for _ in range(count):
+        key = PrivateKey.random()
+        accounts.append(Account(
+            key.public_key.to_base58check_address(), key.public_key.to_hex_address(), key.hex(), None
+        ))
+    return accounts
+
+
+# Decrypted account nodes by (user_id, stored seed); a rotated seed value misses naturally.
+account_nodes = PrivateKeyCache(maxsize=KEY_CACHE_SIZE, ttl=KEY_CACHE_TTL, wrap=lambda node: node)
+
+
+@contextmanager
+def borrow_account_node(user_id: str, hd_seed: str) -> Iterator[AccountNode]:
+    def load() -> AccountNode:
+        return account_node(bytes.fromhex(decrypt_private_key(hd_seed, seed_aad(user_id))))
+
+    with account_nodes.borrow((user_id, hd_seed), load) as node:
+        yield node
+
+
+async def reserve_indexes(db: AsyncSession, user_id: str, count: int) -> Tuple[str, int]:
+    """Stored seed and first of ``count`` fresh derivation indexes for ``user_id``.
+
+    Creates the user's seed on first use. The counter is bumped in the caller's
+    transaction, so concurrent creates for one user queue on the user row and a
+    rolled-back create gives its indexes back.
+    """
+    hd_seed = (await db.execute(select(User.hd_seed).where(User.id == user_id))).scalar_one_or_none()
+    if hd_seed is None:
+        # Conditional so a concurrent first create keeps whichever seed landed first.
+        await db.execute(
+            update(User)
+            .where(User.id == user_id, User.hd_seed.is_(None))
+            .values(hd_seed=encrypt_private_key(new_seed().hex(), seed_aad(user_id)))
+            .execution_options(synchronize_session=False)
+        )
+    row = (await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(hd_next_index=User.hd_next_index + count)
+        .returning(User.hd_seed, User.hd_next_index)
+        .execution_options(synchronize_session=False)
+    )).one()
+    start = row.hd_next_index - count
+    if start + count - 1 > MAX_INDEX:
+        raise ValueError("No derivation indexes left for this user")
+    return row.hd_seed, start
+
+
+async def new_accounts(db: AsyncSession, user_id: str, count: int) -> List[Account]:
+    """``count`` new accounts for ``user_id`` under :data:`WALLET_DERIVATION`; the caller commits."""
+    if WALLET_DERIVATION != "hd":
+        return random_accounts(count) if count == 1 else await run_blocking(random_accounts, count)
+    hd_seed, start = await reserve_indexes(db, user_id, count)
+    with borrow_account_node(user_id, hd_seed) as node:
+        if count == 1:
+            return derive_accounts(node, start, count)
+        return await run_blocking(derive_accounts, node, start, count)
+
+
+def stored_private_key(account: Account) -> Optional[str]:
+    """Value for ``Wallet.private_key``: nothing for derived accounts."""
+    if account.derivation_index is not None:
+        return None
+    return encrypt_private_key(account.private_key, account.address)
+
+
+async def load_wallet_key(db: AsyncSession, user_id: str, address: str) -> Optional[WalletKey]:
+    row = (await db.execute(
+        select(Wallet.private_key, Wallet.derivation_index, User.hd_seed)
+        .join(User, User.id == Wallet.user_id)
+        .where(Wallet.address == address, Wallet.user_id == user_id)
+        .limit(1)
+    )).first()
+    if row is None:
+        return None
+    return WalletKey(user_id, address, row.private_key, row.derivation_index, row.hd_seed)
+
+
+@contextmanager
+def wallet_signing_key(wallet_key: WalletKey) -> Iterator["PrivateKey"]:
+    """Decrypted or derived ``PrivateKey`` for a wallet, served from :data:`keystore.private_keys`."""
+    if wallet_key.private_key is not None:
+        with signing_key(wallet_key.private_key, wallet_key.address) as key:
+            yield key
+        return
+
+    def load() -> bytes:
+        with borrow_account_node(wallet_key.user_id, wallet_key.hd_seed) as node:
+            return derive_key(node, wallet_key.derivation_index)
+
+    with private_keys.borrow((wallet_key.address, wallet_key.hd_seed, wallet_key.derivation_index), load) as key:
+        yield key
+
+
+def private_key_hex(wallet_key: WalletKey) -> str:
+    """Hex private key for export."""
+    if wallet_key.private_key is not None:
+        return decrypt_private_key(wallet_key.private_key, wallet_key.address)
+    with borrow_account_node(wallet_key.user_id, wallet_key.hd_seed) as node:
+        return derive_key(node, wallet_key.derivation_index).hex()
+
+
+def seed_hex(user_id: str, hd_seed: str) -> str:
+    """The user's seed for backup; any BIP-32 tool derives the same wallets from it."""
+    return decrypt_private_key(hd_seed, seed_aad(user_id))
@@ -0,0 +1,152 @@
+import asyncio
+import math
+import os
+from typing import Optional
+
+from cache import cache_backend
+from tron_client import USDT_CONTRACT, AsyncTronNodePool, NodeBudgetExceeded, _is_failover_error
+
+# Configuration
+# Account energy/bandwidth change with every transaction, chain parameters only by proposal.
+FEE_RESOURCE_CACHE_TTL = float(os.getenv("FEE_RESOURCE_CACHE_TTL", "30"))
+FEE_RESOURCE_CACHE_SIZE = int(os.getenv("FEE_RESOURCE_CACHE_SIZE", "10000"))
+FEE_CHAIN_PARAMS_TTL = float(os.getenv("FEE_CHAIN_PARAMS_TTL", "600"))
+# fee_limit = simulated energy * energy price * margin, capped at FEE_LIMIT_MAX
+FEE_LIMIT_MARGIN = float(os.getenv("FEE_LIMIT_MARGIN", "1.2"))
+FEE_LIMIT_MAX = int(os.getenv("FEE_LIMIT_MAX", "100000000"))
+
+# Approximate signed transaction sizes in bytes (bandwidth points), memo included for TRX.
+TRX_TRANSFER_BYTES = 290
+USDT_TRANSFER_BYTES = 350
+SUN = 1_000_000
+
+
+def _fee_limit(energy: int, energy_price: int) -> int:
+    if not energy:
+        return FEE_LIMIT_MAX
+    return min(math.ceil(energy * energy_price * FEE_LIMIT_MARGIN), FEE_LIMIT_MAX)
+
+
+def _transfer_parameter(to_address: str, amount: int) -> str:
+    from tronpy import keys
+
+    # ABI-encoded (address,uint256): 20-byte address and amount, each left-padded to 32 bytes
+    return keys.to_hex_address(to_address)[2:].rjust(64, "0") + format(amount, "064x")
+
+
+class FeeEstimator:
+    """Energy/bandwidth cost of TRX and USDT transfers, from node simulation and cached state.
+
+    USDT energy comes from ``triggerconstantcontract`` run against current chain
+    state, so transfers to addresses without a USDT balance (which cost about
+    twice the energy) are priced correctly. Account resources are cached per
+    address for ``FEE_RESOURCE_CACHE_TTL`` seconds, chain parameters for
+    ``FEE_CHAIN_PARAMS_TTL``.
+    """
+
+    def __init__(self, tron: AsyncTronNodePool):
+        self.tron = tron
+        self.resources = cache_backend("fee_resources", maxsize=FEE_RESOURCE_CACHE_SIZE, ttl=FEE_RESOURCE_CACHE_TTL)
+        self.chain_params = cache_backend("chain_params", maxsize=1, ttl=FEE_CHAIN_PARAMS_TTL)
+
+    async def _chain_parameters(self) -> dict:
+        async def load():
+            params = await self.tron.call(lambda client: client.get_chain_parameters(), method="get_chain_parameters")
+            return {p["key"]: p.get("value", 0) for p in params}
+
+        return await self.chain_params.get_or_load("params", load)
+
+    async def _account_resources(self, address: str) -> Optional[dict]:
+        """Resource state of ``address``, or None if the account is not activated."""
+        from tronpy.exceptions import AddressNotFound
+
+        async def load():
+            try:
+                return await self.tron.call(
+                    lambda client: client.get_account_resource(address), method="get_account_resource"
+                )
+            except AddressNotFound:
+                return None
+
+        return await self.resources.get_or_load(address, load)
+
+    async def _usdt_energy(self, from_address: str, to_address: str, amount: int) -> int:
+        result = await self.tron.call(lambda client: client.trigger_constant_contract(
+            from_address, USDT_CONTRACT, "transfer(address,uint256)", _transfer_parameter(to_address, amount)
+        ), method="trigger_constant_contract")
+        return int(result.get("energy_used", 0)) + int(result.get("energy_penalty", 0))
+
+    async def estimate(self, from_address: str, to_address: str, token: str, amount: int) -> dict:
+        """Resources a transfer needs, what the sender's stake covers, and the TRX burned for the rest."""
+        if token == "USDT":
+            params, sender, energy = await asyncio.gather(
+                self._chain_parameters(),
+                self._account_resources(from_address),
+                self._usdt_energy(from_address, to_address, amount),
+            )
+            recipient_active = True
+            bandwidth = USDT_TRANSFER_BYTES
+        else:
+            params, sender, recipient = await asyncio.gather(
+                self._chain_parameters(),
+                self._account_resources(from_address),
+                self._account_resources(to_address),
+            )
+            recipient_active = recipient is not None
+            energy = 0
+            bandwidth = TRX_TRANSFER_BYTES
+
+        sender = sender or {}
+        energy_price = params.get("getEnergyFee", 420)
+        bandwidth_price = params.get("getTransactionFee", 1000)
+        energy_available = max(sender.get("EnergyLimit", 0) - sender.get("EnergyUsed", 0), 0)
+        bandwidth_available = (
+            max(sender.get("freeNetLimit", 0) - sender.get("freeNetUsed", 0), 0)
+            + max(sender.get("NetLimit", 0) - sender.get("NetUsed", 0), 0)
+        )
+
+        energy_burn = max(energy - energy_available, 0) * energy_price
+        activation_fee = 0
+        if recipient_active:
+            bandwidth_burn = 0 if bandwidth <= bandwidth_available else bandwidth * bandwidth_price
+        else:
+            # Sending TRX to a new address activates it, at a fixed cost instead of bandwidth.
+            bandwidth_burn = params.get("getCreateAccountFee", 100_000)
+            activation_fee = params.get("getCreateNewAccountFeeInSystemContract", 1_000_000)
+
+        fee_limit = _fee_limit(energy, energy_price) if token == "USDT" else None
+
+        return {
+            "token": token,
+            "energy_required": energy,
+            "energy_available": energy_available,
+            "bandwidth_required": bandwidth,
+            "bandwidth_available": bandwidth_available,
+            "recipient_active": recipient_active,
+            "energy_fee": energy_burn / SUN,
+            "bandwidth_fee": bandwidth_burn / SUN,
+            "activation_fee": activation_fee / SUN,
+            "estimated_fee": (energy_burn + bandwidth_burn + activation_fee) / SUN,
+            "fee_limit": fee_limit,
+        }
+
+    async def fee_limit(self, from_address: str, to_address: str, amount: int) -> int:
+        """Tight ``fee_limit`` (sun) for a USDT transfer; the cap if the node rejects the simulation.
+
+        Budget and node errors are raised, not papered over with the cap: the
+        caller retries them like any other node failure.
+        """
+        try:
+            energy = await self._usdt_energy(from_address, to_address, amount)
+            params = await self._chain_parameters()
+        except NodeBudgetExceeded:
+            raise
+        except Exception as e:
+            if _is_failover_error(e, idempotent=True):
+                raise
+            return FEE_LIMIT_MAX
+        return _fee_limit(energy, params.get("getEnergyFee", 420))
+
+    async def invalidate(self, address: str):
+        """Drop cached resources for ``address`` after it spends energy or bandwidth."""
+        await self.resources.delete(address)
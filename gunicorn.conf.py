@@ -0,0 +1,34 @@
+"""Production server: gunicorn managing uvicorn worker processes.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Each worker is a separate process with its own event loop, database pool, TRON
+clients and send queue workers. Set ``CACHE_URL`` so balance, fee, contract and
+revoked-token caches are shared between them instead of being filled once per
+worker, and so only one of them polls blocks for the watcher.
+"""
+import multiprocessing
+import os
+
+# Configuration
+# Render (and most PaaS) set PORT; API_PORT is the local default.
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('PORT', os.getenv('API_PORT', '5000'))}"
+# Worker processes; defaults to one per core, at most 4 so small instances stay within memory.
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+# A worker silent for this long is restarted; covers slow startup (DB connect) and long node calls.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Seconds a stopping worker gets to finish in-flight requests and drain its send queue.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers after this many requests (0 = never), staggered by up to max_requests_jitter.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Proxies allowed to set X-Forwarded-For, which gives the client IP per-IP rate limits use.
+# Those limits are shared by all workers through RATE_LIMIT_STORE, not multiplied by them.
+# Set to the proxy's address(es); "*" lets anyone who can reach the port spoof their IP.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1,::1")
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
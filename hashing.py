@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Optional
+
+from metrics import PASSWORD_HASH_QUEUE
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+# Configuration
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash/verify calls allowed in the pool at once; the rest wait (and show up as queue depth).
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS)))
+# "process" (default) or "thread"; threads are used automatically when processes are unavailable.
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")
+
+_pwd_context: Optional["CryptContext"] = None
+
+
+def _context() -> "CryptContext":
+    # Built lazily so each worker process creates its own context (and passlib is only
+    # imported where hashing actually happens).
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def hash_secret(secret: str) -> str:
+    return _context().hash(secret)
+
+
+def verify_secret(secret: str, hashed: str) -> bool:
+    return _context().verify(secret, hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt hash/verify off the event loop with a bounded concurrency."""
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        concurrency: int = PASSWORD_HASH_CONCURRENCY,
+        executor: str = PASSWORD_HASH_EXECUTOR,
+    ):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.kind = executor
+        self._executor = self._create_executor(executor)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.wait_seconds_total = 0.0
+
+    def _create_executor(self, kind: str) -> Executor:
+        if kind == "process":
+            try:
+                return ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, NotImplementedError, ImportError):
+                # e.g. no working semaphores in the container; fall through to threads
+                pass
+        self.kind = "thread"
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        queued_at = time.perf_counter()
+        self.queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+        waited = time.perf_counter() - queued_at
+        self.wait_seconds_total += waited
+        PASSWORD_HASH_QUEUE.observe(waited)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # Every call in flight on the broken pool lands here; only the first swaps it.
+                if self._executor is executor:
+                    self._executor = self._create_executor("thread")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, secret: str) -> str:
+        return await self._run(hash_secret, secret)
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        return await self._run(verify_secret, secret, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
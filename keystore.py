@@ -0,0 +1,374 @@
+"""Envelope encryption for ``Wallet.private_key`` and ``User.hd_seed``.
+
+Each private key is encrypted with its own random data key (AES-256-GCM), and
+the data key is wrapped with a master key from ``WALLET_KEY_FILE``. The wallet
+address is bound in as associated data, so a ciphertext cannot be moved to
+another row. Rotating the master key only re-wraps the small data keys:
+
+    python keystore.py init      # create WALLET_KEY_FILE with a first master key
+    python keystore.py rotate    # add a new master key and make it primary
+    python keystore.py rewrap    # re-wrap every row under the primary key (encrypts plaintext rows too)
+    python keystore.py status    # count wallet keys and seeds per master key
+
+Without ``WALLET_KEY_FILE`` keys are stored as plaintext hex, as before.
+"""
+import asyncio
+import base64
+import ctypes
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterator, Optional
+
+from Crypto.Cipher import AES
+
+if TYPE_CHECKING:
+    from tronpy.keys import PrivateKey
+
+# Configuration
+WALLET_KEY_FILE = os.getenv("WALLET_KEY_FILE")
+# Decrypted keys kept in memory for signing; zeroed when they expire or are evicted.
+KEY_CACHE_TTL = float(os.getenv("KEY_CACHE_TTL", "60"))
+KEY_CACHE_SIZE = int(os.getenv("KEY_CACHE_SIZE", "1000"))
+# Seconds between background sweeps that zero expired keys even when nothing is being signed.
+KEY_CACHE_SWEEP_INTERVAL = float(os.getenv("KEY_CACHE_SWEEP_INTERVAL", "5"))
+
+PREFIX = "enc:v1"
+
+
+class KeyStoreError(Exception):
+    pass
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data.encode())
+
+
+def _seal(key: bytes, plaintext: bytes, aad: bytes) -> bytes:
+    cipher = AES.new(key, AES.MODE_GCM)
+    cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return cipher.nonce + ciphertext + tag
+
+
+def _open(key: bytes, sealed: bytes, aad: bytes) -> bytes:
+    nonce, ciphertext, tag = sealed[:16], sealed[16:-16], sealed[-16:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(aad)
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+def is_encrypted(stored: str) -> bool:
+    return stored.startswith(PREFIX + ":")
+
+
+def seed_aad(user_id: str) -> str:
+    """Associated data for a user's HD seed; keeps seeds and wallet keys from being swapped."""
+    return f"hd-seed:{user_id}"
+
+
+class KeyStore:
+    """Master keys by id, one of which is primary and wraps new data keys."""
+
+    def __init__(self, keys: Dict[str, bytes], primary: str):
+        if primary not in keys:
+            raise KeyStoreError(f"Primary key '{primary}' is not in the key file")
+        self.keys = keys
+        self.primary = primary
+
+    @classmethod
+    def load(cls, path: str) -> "KeyStore":
+        with open(path) as f:
+            data = json.load(f)
+        return cls({kid: _unb64(key) for kid, key in data["keys"].items()}, data["primary"])
+
+    def save(self, path: str):
+        data = {"primary": self.primary, "keys": {kid: _b64(key) for kid, key in self.keys.items()}}
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def add_key(self) -> str:
+        kid = f"k{len(self.keys) + 1}"
+        self.keys[kid] = secrets.token_bytes(32)
+        self.primary = kid
+        return kid
+
+    def encrypt(self, plaintext: str, aad: str) -> str:
+        data_key = secrets.token_bytes(32)
+        wrapped = _seal(self.keys[self.primary], data_key, aad.encode())
+        sealed = _seal(data_key, plaintext.encode(), aad.encode())
+        return f"{PREFIX}:{self.primary}:{_b64(wrapped)}:{_b64(sealed)}"
+
+    def _unwrap(self, stored: str, aad: str):
+        try:
+            _, _, kid, wrapped, sealed = stored.split(":")
+        except ValueError:
+            raise KeyStoreError("Malformed encrypted value")
+        if kid not in self.keys:
+            raise KeyStoreError(f"Master key '{kid}' is not in the key file")
+        return kid, _open(self.keys[kid], _unb64(wrapped), aad.encode()), sealed
+
+    def decrypt(self, stored: str, aad: str) -> bytes:
+        if not is_encrypted(stored):
+            return stored.encode()
+        _, data_key, sealed = self._unwrap(stored, aad)
+        return _open(data_key, _unb64(sealed), aad.encode())
+
+    def rewrap(self, stored: str, aad: str) -> str:
+        """``stored`` with its data key wrapped by the primary key; plaintext gets encrypted."""
+        if not is_encrypted(stored):
+            return self.encrypt(stored, aad)
+        kid, data_key, sealed = self._unwrap(stored, aad)
+        if kid == self.primary:
+            return stored
+        wrapped = _seal(self.keys[self.primary], data_key, aad.encode())
+        return f"{PREFIX}:{self.primary}:{_b64(wrapped)}:{sealed}"
+
+
+_keystore: Optional[KeyStore] = None
+_keystore_lock = threading.Lock()
+
+
+def get_keystore(reload: bool = False) -> Optional[KeyStore]:
+    """The keystore from ``WALLET_KEY_FILE``, or None when encryption is not configured."""
+    global _keystore
+    if WALLET_KEY_FILE and (_keystore is None or reload):
+        with _keystore_lock:
+            if _keystore is None or reload:
+                _keystore = KeyStore.load(WALLET_KEY_FILE)
+    return _keystore
+
+
+def encrypt_private_key(private_key: str, address: str) -> str:
+    """Value to store in ``Wallet.private_key``."""
+    keystore = get_keystore()
+    return keystore.encrypt(private_key, address) if keystore else private_key
+
+
+def decrypt_private_key(stored: str, address: str) -> str:
+    """Hex private key from a stored (encrypted or legacy plaintext) value."""
+    if not is_encrypted(stored):
+        return stored
+    keystore = get_keystore()
+    if keystore is None:
+        raise KeyStoreError("Wallet key is encrypted but WALLET_KEY_FILE is not set")
+    if stored.split(":")[2] not in keystore.keys:
+        # Rotated (and re-wrapped) by another process since this one loaded the key file.
+        keystore = get_keystore(reload=True)
+    return keystore.decrypt(stored, address).decode()
+
+
+def _wipe(data: Any):
+    if isinstance(data, tuple):
+        # Structured secrets (e.g. an HD account node) keep theirs in bytearray fields.
+        for part in data:
+            if isinstance(part, bytearray):
+                _wipe(part)
+        return
+    if isinstance(data, bytearray):
+        data[:] = bytes(len(data))
+        return
+    # Best effort: overwrite the bytes object's buffer in place (CPython layout).
+    offset = sys.getsizeof(data) - len(data) - 1
+    ctypes.memset(id(data) + offset, 0, len(data))
+
+
+def _private_key(raw: bytes) -> "PrivateKey":
+    from tronpy.keys import PrivateKey
+
+    return PrivateKey(raw)
+
+
+class _Entry:
+    __slots__ = ("key", "raw", "expires_at", "users", "evicted")
+
+    def __init__(self, raw: Any, expires_at: float, wrap: Callable[[Any], Any]):
+        self.raw = raw
+        self.key = wrap(raw)
+        self.expires_at = expires_at
+        self.users = 0
+        self.evicted = False
+
+
+_key_caches: "weakref.WeakSet[PrivateKeyCache]" = weakref.WeakSet()
+
+
+class PrivateKeyCache:
+    """Bounded, TTL-limited cache of decrypted ``PrivateKey`` objects.
+
+    ``load`` returns the raw secret and ``wrap`` turns it into what borrowers
+    get; by default raw key bytes become a ``PrivateKey``. Keys are handed out
+    with :meth:`borrow`; an entry evicted while borrowed is zeroed once the last
+    borrower is done with it. Expired entries are swept on
+    ``borrow`` and by :func:`sweep_key_caches`, so an idle worker does not keep
+    keys in memory past their TTL.
+    """
+
+    def __init__(self, maxsize: int = KEY_CACHE_SIZE, ttl: float = KEY_CACHE_TTL, wrap: Callable[[Any], Any] = _private_key):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.wrap = wrap
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        _key_caches.add(self)
+
+    def _evict(self, entry: _Entry):
+        entry.evicted = True
+        if entry.users == 0:
+            _wipe(entry.raw)
+
+    def _purge_expired(self, now: float):
+        # Sweep at most once a second so idle keys are zeroed without scanning on every borrow.
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 1.0
+        expired = [k for k, entry in self._data.items() if entry.expires_at <= now]
+        for k in expired:
+            self._evict(self._data.pop(k))
+
+    def purge_expired(self):
+        """Zero every expired entry now."""
+        with self._lock:
+            self._next_purge = 0.0
+            self._purge_expired(time.monotonic())
+
+    @contextmanager
+    def borrow(self, cache_key: Hashable, load: Callable[[], Any]) -> Iterator[Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._data.get(cache_key)
+            if entry is not None and entry.expires_at <= now:
+                self._evict(self._data.pop(cache_key))
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(cache_key)
+                entry.users += 1
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            # Decrypt outside the lock; a concurrent miss for the same key just replaces the entry.
+            entry = _Entry(load(), now + self.ttl, self.wrap)
+            with self._lock:
+                previous = self._data.pop(cache_key, None)
+                if previous is not None:
+                    self._evict(previous)
+                self._data[cache_key] = entry
+                entry.users += 1
+                while len(self._data) > self.maxsize:
+                    self._evict(self._data.popitem(last=False)[1])
+        try:
+            yield entry.key
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.evicted and entry.users == 0:
+                    _wipe(entry.raw)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._data.values():
+                self._evict(entry)
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+private_keys = PrivateKeyCache()
+
+
+async def sweep_key_caches(interval: float = KEY_CACHE_SWEEP_INTERVAL):
+    """Zero expired entries of every :class:`PrivateKeyCache` each ``interval`` seconds; runs until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        for cache in list(_key_caches):
+            cache.purge_expired()
+
+
+@contextmanager
+def signing_key(stored: str, address: str) -> Iterator["PrivateKey"]:
+    """Decrypted ``PrivateKey`` for a stored wallet key, served from :data:`private_keys`."""
+    with private_keys.borrow((address, stored), lambda: bytes.fromhex(decrypt_private_key(stored, address))) as key:
+        yield key
+
+
+# CLI
+
+def _rewrap_all(keystore: KeyStore) -> int:
+    from sqlalchemy import select
+    from database import SessionLocal, User, Wallet
+
+    changed = 0
+    with SessionLocal() as db:
+        # HD wallets have no key of their own; their user's seed is re-wrapped below.
+        for wallet in db.execute(select(Wallet).where(Wallet.private_key.is_not(None))).scalars():
+            updated = keystore.rewrap(wallet.private_key, wallet.address)
+            if updated != wallet.private_key:
+                wallet.private_key = updated
+                changed += 1
+        for user in db.execute(select(User).where(User.hd_seed.is_not(None))).scalars():
+            updated = keystore.rewrap(user.hd_seed, seed_aad(user.id))
+            if updated != user.hd_seed:
+                user.hd_seed = updated
+                changed += 1
+        db.commit()
+    return changed
+
+
+def _status() -> Dict[str, int]:
+    from sqlalchemy import select
+    from database import SessionLocal, User, Wallet
+
+    counts: Dict[str, int] = {}
+    with SessionLocal() as db:
+        for kind, column in (("wallet", Wallet.private_key), ("seed", User.hd_seed)):
+            for stored in db.execute(select(column).where(column.is_not(None))).scalars():
+                kid = stored.split(":")[2] if is_encrypted(stored) else "plaintext"
+                counts[f"{kind} {kid}"] = counts.get(f"{kind} {kid}", 0) + 1
+    return counts
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if not WALLET_KEY_FILE:
+        sys.exit("WALLET_KEY_FILE is not set")
+
+    if command == "init":
+        if os.path.exists(WALLET_KEY_FILE):
+            sys.exit(f"{WALLET_KEY_FILE} already exists")
+        keystore = KeyStore({"k1": secrets.token_bytes(32)}, "k1")
+        keystore.save(WALLET_KEY_FILE)
+        print(f"Created {WALLET_KEY_FILE} with master key k1")
+    elif command == "rotate":
+        keystore = KeyStore.load(WALLET_KEY_FILE)
+        kid = keystore.add_key()
+        keystore.save(WALLET_KEY_FILE)
+        print(f"Added master key {kid} as primary; run `python keystore.py rewrap` to move existing rows")
+    elif command == "rewrap":
+        print(f"Re-wrapped {_rewrap_all(KeyStore.load(WALLET_KEY_FILE))} wallet keys and seeds")
+    elif command == "status":
+        for kid, count in sorted(_status().items()):
+            print(f"{kid}  {count}")
+    else:
+        sys.exit(f"Unknown command '{command}'")
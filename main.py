@@ -1,33 +1,86 @@
 import os
+import io
+import csv
 import json
+import math
 import hashlib
+import logging
 import secrets
-from datetime import datetime, timedelta
-from typing import Optional, List
-from faker import Faker
-import qrcode
-from io import BytesIO
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Type
 import base64
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 import jwt
-from passlib.context import CryptContext
-from tronpy import Tron
-from tronpy.keys import PrivateKey
-from sqlalchemy.orm import Session
-from database import get_db, init_db, User, Wallet, DemoProfile as DemoProfileModel
-
-init_db()
-
-app = FastAPI(title="TRON Wallet API", version="1.0.0")
+import orjson
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine, get_async_db, pool_status, User, Wallet, SendJob, DemoProfile as DemoProfileModel
+from tron_client import AsyncTronNodePool, NodeBudgetExceeded, _is_failover_error, is_base58check_address
+from balances import BalanceLookupError, BalanceService
+from hashing import PasswordHasher
+from executor import run_blocking, shutdown_executor
+from qr import QRRenderer
+from tx_history import TOKEN_DECIMALS, TOKENS, TransactionHistory, serialize as serialize_transaction
+from send_queue import BATCH_KEY_PREFIX, PENDING, SendQueue, serialize as serialize_send_job
+from fees import FeeEstimator
+from keystore import encrypt_private_key, private_keys, sweep_key_caches
+from derivation import HD_ACCOUNT_PATH, account_nodes, load_wallet_key, new_accounts, private_key_hex, random_accounts, seed_hex, stored_private_key
+from watcher import WATCHER_ENABLED, BlockWatcher
+from cache import CACHE_URL, CacheUnavailable, SharedChannel, TTLCache, cache_backend, close_shared_caches
+from ratelimit import ClientLimiter
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, Family, MetricsMiddleware, cache_families, hasher_families, pool_families
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect here rather than at import: a bad DATABASE_URL fails startup, and the
+    # first request finds a warm pooled connection.
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    # Cheap to build; tronpy, qrcode and faker are imported on first use.
+    app.state.tron = AsyncTronNodePool.from_env()
+    app.state.balances = BalanceService(app.state.tron)
+    app.state.hasher = PasswordHasher()
+    app.state.qr = QRRenderer()
+    app.state.history = TransactionHistory(app.state.tron, AsyncSessionLocal)
+    app.state.watcher = BlockWatcher(app.state.tron, app.state.balances, app.state.history, AsyncSessionLocal)
+    if WATCHER_ENABLED:
+        app.state.watcher.start()
+    app.state.fees = FeeEstimator(app.state.tron)
+    app.state.sender = SendQueue(app.state.tron, app.state.balances, app.state.fees, AsyncSessionLocal)
+    app.state.sender.start()
+    key_sweeper = asyncio.create_task(sweep_key_caches())
+    revocation_follower = asyncio.create_task(follow_revocations()) if revocations is not None else None
+    try:
+        yield
+    finally:
+        key_sweeper.cancel()
+        if revocation_follower is not None:
+            revocation_follower.cancel()
+        await app.state.sender.stop()
+        await app.state.watcher.stop()
+        await app.state.tron.close()
+        await close_shared_caches()
+        client_limits.close()
+        app.state.hasher.shutdown()
+        await async_engine.dispose()
+        shutdown_executor()
+
+# Responses are rendered with orjson; endpoints with a response_model are validated
+# and dumped once by pydantic-core instead of going through jsonable_encoder.
+app = FastAPI(title="TRON Wallet API", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-fake = Faker()
 
 # CORS middleware
 app.add_middleware(
@@ -37,6 +90,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it wraps everything, CORS preflights included.
+app.add_middleware(MetricsMiddleware)
 
 # Configuration
 SECRET_KEY = os.getenv("SESSION_SECRET")
@@ -44,8 +99,35 @@ if not SECRET_KEY:
     raise ValueError("SESSION_SECRET environment variable must be set for secure JWT token generation")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
-TRON_NETWORK = os.getenv("TRON_NETWORK", "mainnet")
-USDT_CONTRACT = os.getenv("USDT_CONTRACT", "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t")  # USDT-TRC20 mainnet
+BALANCE_BATCH_MAX = int(os.getenv("BALANCE_BATCH_MAX", "500"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# With CACHE_URL set, seconds a worker trusts a verified token before checking the shared
+# revocation list again; bounds the delay if it missed another worker's logout broadcast.
+TOKEN_REVOCATION_RECHECK = float(os.getenv("TOKEN_REVOCATION_RECHECK", "60"))
+# Accept tokens the shared revocation list cannot be checked for (cache server down)? See README.
+TOKEN_REVOCATION_FAIL_OPEN = os.getenv("TOKEN_REVOCATION_FAIL_OPEN", "true").lower() in ("1", "true", "yes")
+WALLET_PAGE_SIZE = int(os.getenv("WALLET_PAGE_SIZE", "100"))
+WALLET_PAGE_MAX = int(os.getenv("WALLET_PAGE_MAX", "1000"))
+QR_CACHE_CONTROL = os.getenv("QR_CACHE_CONTROL", "public, max-age=86400, immutable")
+EVENTS_MAX_ADDRESSES = int(os.getenv("EVENTS_MAX_ADDRESSES", "100"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+# POST /send?wait=true: how long to hold the request open for the broadcast
+SEND_WAIT_TIMEOUT = float(os.getenv("SEND_WAIT_TIMEOUT", "10"))
+SEND_BATCH_MAX = int(os.getenv("SEND_BATCH_MAX", "500"))
+WALLET_BATCH_MAX = int(os.getenv("WALLET_BATCH_MAX", "1000"))
+
+# Verified tokens -> user_id, each entry expiring with the token's own `exp` (or sooner,
+# see TOKEN_REVOCATION_RECHECK). Kept per worker so a hit costs no round trip.
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# Tokens revoked via /auth/logout, kept only until they would have expired anyway.
+# Shared when CACHE_URL is set, so a logout holds on every worker.
+revoked_tokens = cache_backend("revoked_tokens", maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# Revocations this worker knows of: its own logouts and those other workers broadcast on
+# `revocations`. Checked before token_cache, so a logout takes effect here at once.
+revoked_locally = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+revocations = SharedChannel("revoked_tokens") if CACHE_URL else None
+# Per client IP on unauthenticated endpoints (RATE_LIMIT_PER_IP / RATE_LIMIT_BURST), across all workers on the host
+client_limits = ClientLimiter()
 
 # Pydantic Models
 class UserRegister(BaseModel):
@@ -59,6 +141,10 @@ class UserLogin(BaseModel):
 class WalletCreate(BaseModel):
     name: str = "My Wallet"
 
+class WalletBatchCreate(BaseModel):
+    count: int
+    name: str = "My Wallet"
+
 class WalletImport(BaseModel):
     name: str
     private_key: str
@@ -69,6 +155,18 @@ class TransactionSend(BaseModel):
     amount: float
     token_type: str = "TRX"
 
+class BatchTransfer(BaseModel):
+    to_address: str
+    amount: float
+    token_type: str = "TRX"
+
+class TransactionBatchSend(BaseModel):
+    from_address: str
+    transfers: List[BatchTransfer]
+
+class BalanceBatchRequest(BaseModel):
+    addresses: List[str]
+
 class DemoProfile(BaseModel):
     phone: str
     email: str
@@ -77,6 +175,150 @@ class DemoProfile(BaseModel):
     balance_trx: float
     balance_usdt: float
 
+# Response Models
+# Item models that support `fields=` have only optional fields; their endpoints use
+# response_model_exclude_unset so keys left out of the dict are left out of the JSON.
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+    user_id: str
+
+class MessageResponse(BaseModel):
+    message: str
+
+class WalletCreated(BaseModel):
+    wallet_id: str
+    name: str
+    address: str
+    private_key: str
+    derivation_index: Optional[int]
+    gmail: Optional[str]
+    phone: Optional[str]
+    password: Optional[str]
+    created_at: str
+
+class WalletSummary(BaseModel):
+    wallet_id: Optional[str] = None
+    name: Optional[str] = None
+    address: Optional[str] = None
+    is_used: Optional[bool] = None
+    derivation_index: Optional[int] = None
+    created_at: Optional[str] = None
+
+class WalletBatchCreated(BaseModel):
+    wallets: List[WalletSummary]
+
+class WalletPage(BaseModel):
+    wallets: List[WalletSummary]
+    next_cursor: Optional[str]
+
+class WalletDetail(BaseModel):
+    wallet_id: Optional[str] = None
+    name: Optional[str] = None
+    address: Optional[str] = None
+    private_key: Optional[str] = None
+    derivation_index: Optional[int] = None
+    gmail: Optional[str] = None
+    phone: Optional[str] = None
+    password: Optional[str] = None
+    is_used: Optional[bool] = None
+    created_at: Optional[str] = None
+
+class WalletSeed(BaseModel):
+    seed: str
+    derivation_path: str
+    wallets_derived: int
+
+class WalletExport(BaseModel):
+    private_key: str
+    address: str
+
+class WalletUsage(BaseModel):
+    wallet_id: str
+    is_used: bool
+    message: str
+
+class TokenBalances(BaseModel):
+    TRX: float
+    USDT: float
+
+class BalanceResponse(BaseModel):
+    address: str
+    balances: TokenBalances
+    updated_at: str
+
+class BalanceBatchItem(BaseModel):
+    address: str
+    balances: Optional[TokenBalances] = None
+    updated_at: Optional[str] = None
+    error: Optional[str] = None
+
+class BalanceBatchResponse(BaseModel):
+    results: List[BalanceBatchItem]
+    count: int
+
+class SendJobResponse(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    job_id: str
+    status: str
+    transaction_id: Optional[str]
+    from_address: str = Field(alias="from")
+    to_address: str = Field(alias="to")
+    amount: float
+    token: str
+    attempts: int
+    error: Optional[str]
+    block_number: Optional[int]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+
+class SendBatchResponse(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_address: str = Field(alias="from")
+    results: List[SendJobResponse]
+    count: int
+    failed: int
+
+class FeeEstimateResponse(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_address: str = Field(alias="from")
+    to_address: str = Field(alias="to")
+    amount: float
+    token: str
+    energy_required: int
+    energy_available: int
+    bandwidth_required: int
+    bandwidth_available: int
+    recipient_active: bool
+    energy_fee: float
+    bandwidth_fee: float
+    activation_fee: float
+    estimated_fee: float
+    fee_limit: Optional[int]
+
+class TransactionItem(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    txid: Optional[str] = None
+    token: Optional[str] = None
+    direction: Optional[str] = None
+    from_address: Optional[str] = Field(None, alias="from")
+    to_address: Optional[str] = Field(None, alias="to")
+    amount: Optional[float] = None
+    block_number: Optional[int] = None
+    timestamp: Optional[str] = None
+    status: Optional[str] = None
+
+class TransactionPage(BaseModel):
+    address: str
+    transactions: List[TransactionItem]
+    count: int
+    next_cursor: Optional[str]
+    synced: bool
+
 # Helper Functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -85,22 +327,159 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return user_id
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def forget_token(token: str, ttl: float):
+    token_cache.pop(token)
+    revoked_locally.set(token, True, ttl=ttl)
+
+async def revoke_token(token: str):
+    payload = decode_token(token)
+    ttl = payload["exp"] - time.time()
+    if ttl <= 0:
+        return
+    forget_token(token, ttl)
+    # Raises CacheUnavailable (503) rather than report a logout other workers would not honour.
+    await revoked_tokens.set(token, True, ttl=ttl)
+    if revocations is not None:
+        await revocations.publish({"token": token, "ttl": ttl})
+
+async def follow_revocations():
+    """Apply logouts broadcast by other workers to this worker's token caches."""
+    async for message in revocations.listen():
+        forget_token(message["token"], message["ttl"])
+
+async def is_revoked(token: str) -> bool:
+    try:
+        return bool(await revoked_tokens.get(token))
+    except CacheUnavailable as e:
+        if not TOKEN_REVOCATION_FAIL_OPEN:
+            raise
+        # Fail open: the signature and expiry still hold, and so do revocations this worker has seen.
+        logger.warning("Revocation list unavailable, accepting token on its signature: %s", e)
+        return False
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    if revoked_locally.get(token):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    # Entries expire by the token's `exp`, so a hit is still valid; revocations clear them.
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    payload = decode_token(token)
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if await is_revoked(token):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    ttl = payload["exp"] - time.time() if "exp" in payload else None
+    if CACHE_URL:
+        ttl = TOKEN_REVOCATION_RECHECK if ttl is None else min(ttl, TOKEN_REVOCATION_RECHECK)
+    if ttl is None or ttl > 0:
+        token_cache.set(token, user_id, ttl=ttl)
+    return user_id
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[List[str]]:
+    """Names requested via ``fields=a,b``, checked against ``model``; None means all."""
+    if fields is None:
+        return None
+    allowed = [f.alias or name for name, f in model.model_fields.items()]
+    selected = [name for name in dict.fromkeys(part.strip() for part in fields.split(",")) if name]
+    unknown = [name for name in selected if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    if not selected:
+        raise HTTPException(status_code=400, detail="No fields given")
+    return selected
+
+def project(item: dict, selected: Optional[List[str]]) -> dict:
+    return item if selected is None else {name: item[name] for name in selected}
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def get_tron(request: Request) -> AsyncTronNodePool:
+    return request.app.state.tron
+
+def get_balances(request: Request) -> BalanceService:
+    return request.app.state.balances
+
+def get_hasher(request: Request) -> PasswordHasher:
+    return request.app.state.hasher
+
+def get_qr(request: Request) -> QRRenderer:
+    return request.app.state.qr
+
+def get_history(request: Request) -> TransactionHistory:
+    return request.app.state.history
+
+def get_watcher(request: Request) -> BlockWatcher:
+    return request.app.state.watcher
+
+def get_sender(request: Request) -> SendQueue:
+    return request.app.state.sender
+
+def get_fees(request: Request) -> FeeEstimator:
+    return request.app.state.fees
+
+async def rate_limit(request: Request):
+    """Token bucket per client IP for endpoints that need no auth"""
+    retry_after = await client_limits.acquire(request.client.host if request.client else "unknown")
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+@app.exception_handler(NodeBudgetExceeded)
+async def node_budget_exceeded(request: Request, exc: NodeBudgetExceeded):
+    # Shed load with a clear signal instead of queueing until the node bans us.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "TRON node is busy, please retry"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(CacheUnavailable)
+async def cache_unavailable(request: Request, exc: CacheUnavailable):
+    # Only lookups that must not fall back to the node get here, e.g. revoked tokens.
+    return JSONResponse(status_code=503, content={"detail": "Shared cache unavailable, please retry"})
+
+@lru_cache(maxsize=None)
+def get_faker(locale: Optional[str] = None):
+    """Faker instance per locale, created (and faker imported) on first use."""
+    from faker import Faker
+    return Faker(locale)
+
 def generate_demo_profile() -> DemoProfile:
     """Generate realistic demo profile with fake data"""
+    fake = get_faker()
     countries = ["en_US", "en_GB", "en_AU"]
-    fake_locale = Faker(fake.random.choice(countries))
+    fake_locale = get_faker(fake.random.choice(countries))
 
     password = ''.join(fake.random.choices(
         'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$', 
@@ -111,8 +490,7 @@ def generate_demo_profile() -> DemoProfile:
     email = f"{username}@gmail.com"
     phone = fake_locale.phone_number()
 
-    tron = Tron(network=TRON_NETWORK)
-    account = tron.generate_address()
+    account = random_accounts(1)[0]
 
     balance_trx = round(fake.random.uniform(10, 5000), 2)
     balance_usdt = round(fake.random.uniform(100, 10000), 2)
@@ -121,7 +499,7 @@ def generate_demo_profile() -> DemoProfile:
         phone=phone,
         email=email,
         password=password,
-        wallet_address=account['base58check_address'],
+        wallet_address=account.address,
         balance_trx=balance_trx,
         balance_usdt=balance_usdt
     )
@@ -150,17 +528,17 @@ async def api_info():
     }
 
 # Auth Endpoints
-@app.post("/auth/register", tags=["Auth"])
-async def register(user: UserRegister, db: Session = Depends(get_db)):
+@app.post("/auth/register", tags=["Auth"], response_model=TokenResponse, dependencies=[Depends(rate_limit)])
+async def register(user: UserRegister, db: AsyncSession = Depends(get_async_db), hasher: PasswordHasher = Depends(get_hasher)):
     """Register a new user with PIN and optional password"""
     user_id = hashlib.sha256(user.pin.encode()).hexdigest()[:16]
 
-    existing_user = db.query(User).filter(User.id == user_id).first()
+    existing_user = await db.get(User, user_id)
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed_pin = pwd_context.hash(user.pin)
-    hashed_password = pwd_context.hash(user.password) if user.password else None
+    hashed_pin = await hasher.hash(user.pin)
+    hashed_password = await hasher.hash(user.password) if user.password else None
 
     new_user = User(
         id=user_id,
@@ -169,7 +547,7 @@ async def register(user: UserRegister, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
+    await db.commit()
 
     access_token = create_access_token(
         data={"sub": user_id},
@@ -182,20 +560,20 @@ async def register(user: UserRegister, db: Session = Depends(get_db)):
         "user_id": user_id
     }
 
-@app.post("/auth/login", tags=["Auth"])
-async def login(user: UserLogin, db: Session = Depends(get_db)):
+@app.post("/auth/login", tags=["Auth"], response_model=TokenResponse, dependencies=[Depends(rate_limit)])
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db), hasher: PasswordHasher = Depends(get_hasher)):
     """Login with PIN and optional password"""
     user_id = hashlib.sha256(user.pin.encode()).hexdigest()[:16]
 
-    stored_user = db.query(User).filter(User.id == user_id).first()
+    stored_user = await db.get(User, user_id)
     if not stored_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not pwd_context.verify(user.pin, stored_user.pin_hash):
+    if not await hasher.verify(user.pin, stored_user.pin_hash):
         raise HTTPException(status_code=401, detail="Invalid PIN")
 
     if user.password and stored_user.password_hash:
-        if not pwd_context.verify(user.password, stored_user.password_hash):
+        if not await hasher.verify(user.password, stored_user.password_hash):
             raise HTTPException(status_code=401, detail="Invalid password")
 
     access_token = create_access_token(
@@ -209,16 +587,22 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
         "user_id": user_id
     }
 
+@app.post("/auth/logout", tags=["Auth"], response_model=MessageResponse)
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the current access token"""
+    await revoke_token(credentials.credentials)
+    return {"message": "Logged out successfully"}
+
 # Wallet Endpoints
-@app.post("/wallets/create", tags=["Wallets"])
-async def create_wallet(wallet: WalletCreate, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.post("/wallets/create", tags=["Wallets"], response_model=WalletCreated)
+async def create_wallet(wallet: WalletCreate, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db), watcher: BlockWatcher = Depends(get_watcher)):
     """Create a new TRON wallet with Gmail, phone, and password"""
-    tron = Tron(network=TRON_NETWORK)
-    account = tron.generate_address()
+    account = (await new_accounts(db, user_id, 1))[0]
 
     # Generate realistic credentials
+    fake = get_faker()
     countries = ["en_US", "en_GB", "en_AU"]
-    fake_locale = Faker(fake.random.choice(countries))
+    fake_locale = get_faker(fake.random.choice(countries))
 
     username = fake_locale.user_name()
     gmail = f"{username}@gmail.com"
@@ -233,32 +617,90 @@ async def create_wallet(wallet: WalletCreate, user_id: str = Depends(verify_toke
         id=wallet_id,
         user_id=user_id,
         name=wallet.name,
-        address=account['base58check_address'],
-        private_key=account['private_key'],
-        hex_address=account.get('hex_address', ''),
+        address=account.address,
+        private_key=stored_private_key(account),
+        derivation_index=account.derivation_index,
+        hex_address=account.hex_address,
         gmail=gmail,
         phone=phone,
         password=password
     )
 
     db.add(new_wallet)
-    db.commit()
-    db.refresh(new_wallet)
+    await db.commit()
+    await db.refresh(new_wallet)
+    watcher.watch(new_wallet.address)
 
     return {
         "wallet_id": new_wallet.id,
         "name": new_wallet.name,
         "address": new_wallet.address,
-        "private_key": new_wallet.private_key,
+        "private_key": account.private_key,
+        "derivation_index": new_wallet.derivation_index,
         "gmail": new_wallet.gmail,
         "phone": new_wallet.phone,
         "password": new_wallet.password,
         "created_at": new_wallet.created_at.isoformat()
     }
 
-@app.post("/wallets/import", tags=["Wallets"])
-async def import_wallet(wallet: WalletImport, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.post("/wallets/batch", tags=["Wallets"], response_model=WalletBatchCreated, response_model_exclude_unset=True)
+async def create_wallets_batch(batch: WalletBatchCreate, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db), watcher: BlockWatcher = Depends(get_watcher)):
+    """Create many wallets in one call, derived from the user's HD seed"""
+    if not 1 <= batch.count <= WALLET_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {WALLET_BATCH_MAX}")
+
+    accounts = await new_accounts(db, user_id, batch.count)
+    # Stored in one multi-row insert; no per-wallet credentials for bulk wallets.
+    now = datetime.utcnow()
+    wallets = [
+        Wallet(
+            id=secrets.token_hex(8),
+            user_id=user_id,
+            name=batch.name,
+            address=account.address,
+            private_key=stored_private_key(account),
+            derivation_index=account.derivation_index,
+            hex_address=account.hex_address,
+            created_at=now
+        )
+        for account in accounts
+    ]
+    db.add_all(wallets)
+    await db.commit()
+    for new_wallet in wallets:
+        watcher.watch(new_wallet.address)
+
+    return {
+        "wallets": [
+            {
+                "wallet_id": w.id,
+                "name": w.name,
+                "address": w.address,
+                "derivation_index": w.derivation_index,
+                "created_at": w.created_at.isoformat()
+            }
+            for w in wallets
+        ]
+    }
+
+@app.get("/wallets/seed", tags=["Wallets"], response_model=WalletSeed)
+async def export_seed(user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    """Export the HD seed behind all derived wallets (use with caution!)"""
+    user = (await db.execute(select(User.hd_seed, User.hd_next_index).where(User.id == user_id))).first()
+    if user is None or user.hd_seed is None:
+        raise HTTPException(status_code=404, detail="No HD seed yet; create a wallet first")
+
+    return {
+        "seed": seed_hex(user_id, user.hd_seed),
+        "derivation_path": f"{HD_ACCOUNT_PATH}/{{index}}",
+        "wallets_derived": user.hd_next_index
+    }
+
+@app.post("/wallets/import", tags=["Wallets"], response_model=WalletSummary, response_model_exclude_unset=True)
+async def import_wallet(wallet: WalletImport, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db), watcher: BlockWatcher = Depends(get_watcher)):
     """Import an existing wallet using private key"""
+    from tronpy.keys import PrivateKey
+
     try:
         priv_key = PrivateKey(bytes.fromhex(wallet.private_key))
         address = priv_key.public_key.to_base58check_address()
@@ -269,12 +711,13 @@ async def import_wallet(wallet: WalletImport, user_id: str = Depends(verify_toke
             user_id=user_id,
             name=wallet.name,
             address=address,
-            private_key=wallet.private_key
+            private_key=encrypt_private_key(wallet.private_key, address)
         )
 
         db.add(new_wallet)
-        db.commit()
-        db.refresh(new_wallet)
+        await db.commit()
+        await db.refresh(new_wallet)
+        watcher.watch(new_wallet.address)
 
         return {
             "wallet_id": new_wallet.id,
@@ -285,28 +728,55 @@ async def import_wallet(wallet: WalletImport, user_id: str = Depends(verify_toke
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid private key: {str(e)}")
 
-@app.get("/wallets", tags=["Wallets"])
-async def list_wallets(user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
-    """List all wallets for the authenticated user"""
-    wallets = db.query(Wallet).filter(Wallet.user_id == user_id).all()
+@app.get("/wallets", tags=["Wallets"], response_model=WalletPage, response_model_exclude_unset=True)
+async def list_wallets(
+    limit: int = Query(WALLET_PAGE_SIZE, ge=1, le=WALLET_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma separated wallet fields to return, e.g. address,name"),
+    user_id: str = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List wallets for the authenticated user, oldest first, one page at a time"""
+    selected = parse_fields(fields, WalletSummary)
+    # Only the listed columns are loaded; keys and credentials stay in the database.
+    query = (
+        select(Wallet.id, Wallet.name, Wallet.address, Wallet.is_used, Wallet.derivation_index, Wallet.created_at)
+        .where(Wallet.user_id == user_id)
+        .order_by(Wallet.created_at, Wallet.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(Wallet.created_at, Wallet.id) > tuple_(*decode_cursor(cursor)))
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
 
     return {
         "wallets": [
-            {
+            project({
                 "wallet_id": w.id,
                 "name": w.name,
                 "address": w.address,
-                "is_used": w.is_used if hasattr(w, 'is_used') else False,
+                "is_used": bool(w.is_used),
+                "derivation_index": w.derivation_index,
                 "created_at": w.created_at.isoformat()
-            }
-            for w in wallets
-        ]
+            }, selected)
+            for w in page
+        ],
+        "next_cursor": next_cursor
     }
 
-@app.get("/wallets/{wallet_id}", tags=["Wallets"])
-async def get_wallet(wallet_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.get("/wallets/{wallet_id}", tags=["Wallets"], response_model=WalletDetail, response_model_exclude_unset=True)
+async def get_wallet(
+    wallet_id: str,
+    fields: Optional[str] = Query(None, description="Comma separated wallet fields to return, e.g. address,name"),
+    user_id: str = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get wallet details"""
-    wallet = db.query(Wallet).filter(Wallet.id == wallet_id).first()
+    selected = parse_fields(fields, WalletDetail)
+    wallet = await db.get(Wallet, wallet_id)
 
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
@@ -314,21 +784,26 @@ async def get_wallet(wallet_id: str, user_id: str = Depends(verify_token), db: S
     if wallet.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    return {
+    details = {
         "wallet_id": wallet.id,
         "name": wallet.name,
         "address": wallet.address,
-        "private_key": wallet.private_key,
+        "derivation_index": wallet.derivation_index,
         "gmail": wallet.gmail,
         "phone": wallet.phone,
         "password": wallet.password,
+        "is_used": bool(wallet.is_used),
         "created_at": wallet.created_at.isoformat()
     }
+    # Decrypting or deriving the key is skipped unless it was asked for.
+    if selected is None or "private_key" in selected:
+        details["private_key"] = private_key_hex(await load_wallet_key(db, user_id, wallet.address))
+    return project(details, selected)
 
-@app.delete("/wallets/{wallet_id}", tags=["Wallets"])
-async def delete_wallet(wallet_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.delete("/wallets/{wallet_id}", tags=["Wallets"], response_model=MessageResponse)
+async def delete_wallet(wallet_id: str, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
     """Delete a wallet"""
-    wallet = db.query(Wallet).filter(Wallet.id == wallet_id).first()
+    wallet = await db.get(Wallet, wallet_id)
 
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
@@ -336,15 +811,15 @@ async def delete_wallet(wallet_id: str, user_id: str = Depends(verify_token), db
     if wallet.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    db.delete(wallet)
-    db.commit()
+    await db.delete(wallet)
+    await db.commit()
 
     return {"message": "Wallet deleted successfully"}
 
-@app.get("/wallets/{wallet_id}/export", tags=["Wallets"])
-async def export_private_key(wallet_id: str, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.get("/wallets/{wallet_id}/export", tags=["Wallets"], response_model=WalletExport)
+async def export_private_key(wallet_id: str, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
     """Export private key (use with caution!)"""
-    wallet = db.query(Wallet).filter(Wallet.id == wallet_id).first()
+    wallet = await db.get(Wallet, wallet_id)
 
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
@@ -352,15 +827,17 @@ async def export_private_key(wallet_id: str, user_id: str = Depends(verify_token
     if wallet.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
 
+    wallet_key = await load_wallet_key(db, user_id, wallet.address)
+
     return {
-        "private_key": wallet.private_key,
+        "private_key": private_key_hex(wallet_key),
         "address": wallet.address
     }
 
-@app.patch("/wallets/{wallet_id}/mark-used", tags=["Wallets"])
-async def mark_wallet_used(wallet_id: str, used: bool, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
+@app.patch("/wallets/{wallet_id}/mark-used", tags=["Wallets"], response_model=WalletUsage)
+async def mark_wallet_used(wallet_id: str, used: bool, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
     """Mark wallet as used or unused"""
-    wallet = db.query(Wallet).filter(Wallet.id == wallet_id).first()
+    wallet = await db.get(Wallet, wallet_id)
 
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
@@ -369,7 +846,7 @@ async def mark_wallet_used(wallet_id: str, used: bool, user_id: str = Depends(ve
         raise HTTPException(status_code=403, detail="Access denied")
 
     wallet.is_used = used
-    db.commit()
+    await db.commit()
 
     return {
         "wallet_id": wallet.id,
@@ -378,138 +855,341 @@ async def mark_wallet_used(wallet_id: str, used: bool, user_id: str = Depends(ve
     }
 
 # Balance & Transaction Endpoints
-@app.get("/balance/{address}", tags=["Transactions"])
-async def get_balance(address: str):
+@app.get("/balance/{address}", tags=["Transactions"], response_model=BalanceResponse, dependencies=[Depends(rate_limit)])
+async def get_balance(address: str, balances: BalanceService = Depends(get_balances)):
     """Get TRX and USDT-TRC20 balance for an address"""
     try:
-        tron = Tron(network=TRON_NETWORK)
-    except Exception:
-        return {
-            "address": address,
-            "balances": {
-                "TRX": 0,
-                "USDT": 0
-            },
-            "updated_at": datetime.utcnow().isoformat()
-        }
-    
-    try:
-        trx_balance = tron.get_account_balance(address)
-    except Exception:
-        trx_balance = 0
-
-    try:
-        contract = tron.get_contract(USDT_CONTRACT)
-        usdt_balance = contract.functions.balanceOf(address) / 1_000_000
-    except Exception:
-        usdt_balance = 0
+        result = await balances.get(address)
+    except BalanceLookupError as e:
+        for error in e.errors:
+            if isinstance(error, NodeBudgetExceeded):
+                raise error
+        result = e.balances
 
     return {
         "address": address,
         "balances": {
-            "TRX": trx_balance,
-            "USDT": usdt_balance
+            "TRX": result["TRX"],
+            "USDT": result["USDT"]
         },
-        "updated_at": datetime.utcnow().isoformat()
+        "updated_at": result["updated_at"]
     }
 
-@app.post("/send", tags=["Transactions"])
-async def send_transaction(tx: TransactionSend, user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
-    """Send TRX or USDT-TRC20 tokens"""
-    try:
-        wallet = db.query(Wallet).filter(
-            Wallet.address == tx.from_address,
-            Wallet.user_id == user_id
-        ).first()
+@app.post("/balance/batch", tags=["Transactions"], response_model=BalanceBatchResponse, response_model_exclude_unset=True, dependencies=[Depends(rate_limit)])
+async def get_balance_batch(batch: BalanceBatchRequest, balances: BalanceService = Depends(get_balances)):
+    """Get TRX and USDT-TRC20 balances for many addresses in one call"""
+    addresses = list(dict.fromkeys(batch.addresses))
+    if not addresses:
+        raise HTTPException(status_code=400, detail="No addresses given")
+    if len(addresses) > BALANCE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {BALANCE_BATCH_MAX} addresses per batch")
 
-        if not wallet:
-            raise HTTPException(status_code=404, detail="Wallet not found or access denied")
+    results = await balances.get_many(addresses)
 
-        tron = Tron(network=TRON_NETWORK)
-        priv_key = PrivateKey(bytes.fromhex(wallet.private_key))
+    return {
+        "results": results,
+        "count": len(results)
+    }
 
-        if tx.token_type == "TRX":
-            txn = (
-                tron.trx.transfer(tx.from_address, tx.to_address, int(tx.amount * 1_000_000))
-                .memo("TRON Wallet Transaction")
-                .build()
-                .sign(priv_key)
-            )
-            result = txn.broadcast()
-
-            return {
-                "transaction_id": result.get('txid'),
-                "from": tx.from_address,
-                "to": tx.to_address,
-                "amount": tx.amount,
-                "token": "TRX",
-                "status": "broadcasted"
-            }
-        else:
-            contract = tron.get_contract(USDT_CONTRACT)
-
-            txn = (
-                contract.functions.transfer(tx.to_address, int(tx.amount * 1_000_000))
-                .with_owner(tx.from_address)
-                .fee_limit(100_000_000)
-                .build()
-                .sign(priv_key)
-            )
-            result = txn.broadcast()
-
-            return {
-                "transaction_id": result.get('txid'),
-                "from": tx.from_address,
-                "to": tx.to_address,
-                "amount": tx.amount,
-                "token": "USDT-TRC20",
-                "status": "broadcasted"
-            }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Transaction failed: {str(e)}")
+@app.post("/send", tags=["Transactions"], response_model=SendJobResponse)
+async def send_transaction(
+    tx: TransactionSend,
+    response: Response,
+    wait: bool = False,
+    idempotency_key: Optional[str] = Header(None, max_length=128),
+    user_id: str = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_db),
+    sender: SendQueue = Depends(get_sender)
+):
+    """Queue a TRX or USDT-TRC20 transfer; poll GET /send/{job_id} for its status"""
+    token = "TRX" if tx.token_type == "TRX" else "USDT"
+    amount = round(tx.amount * TOKEN_DECIMALS)
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    if not is_base58check_address(tx.to_address):
+        raise HTTPException(status_code=400, detail="Invalid destination address")
+    if idempotency_key and idempotency_key.startswith(BATCH_KEY_PREFIX):
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must not start with '{BATCH_KEY_PREFIX}'")
+
+    result = await db.execute(select(Wallet.id).where(
+        Wallet.address == tx.from_address,
+        Wallet.user_id == user_id
+    ).limit(1))
+    if result.scalars().first() is None:
+        raise HTTPException(status_code=404, detail="Wallet not found or access denied")
+
+    job, created = await sender.submit(db, user_id, tx.from_address, tx.to_address, token, amount, idempotency_key)
+    if not created and (job.from_address, job.to_address, job.token, job.amount) != (tx.from_address, tx.to_address, token, amount):
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different transfer")
+
+    if wait and await sender.wait(job.id, SEND_WAIT_TIMEOUT):
+        await db.refresh(job)
+
+    response.status_code = status.HTTP_202_ACCEPTED if job.status in PENDING else status.HTTP_200_OK
+    return serialize_send_job(job)
+
+@app.post("/send/estimate", tags=["Transactions"], response_model=FeeEstimateResponse, dependencies=[Depends(rate_limit)])
+async def estimate_fee(tx: TransactionSend, fees: FeeEstimator = Depends(get_fees)):
+    """Estimate energy, bandwidth and TRX fee for a transfer, and the fee_limit /send would use"""
+    token = "TRX" if tx.token_type == "TRX" else "USDT"
+    amount = round(tx.amount * TOKEN_DECIMALS)
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    if not is_base58check_address(tx.from_address) or not is_base58check_address(tx.to_address):
+        raise HTTPException(status_code=400, detail="Invalid TRON address")
 
-@app.get("/transactions/{address}", tags=["Transactions"])
-async def get_transaction_history(address: str, limit: int = 20):
-    """Get transaction history for an address"""
     try:
-        tron = Tron(network=TRON_NETWORK)
-        transactions = tron.get_account_transactions(address, limit=limit)
+        estimate = await fees.estimate(tx.from_address, tx.to_address, token, amount)
+    except NodeBudgetExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Estimation failed: {str(e)}")
 
-        return {
-            "address": address,
-            "transactions": transactions,
-            "count": len(transactions)
-        }
+    return {
+        "from": tx.from_address,
+        "to": tx.to_address,
+        "amount": tx.amount,
+        **estimate
+    }
+
+@app.post("/send/batch", tags=["Transactions"], response_model=SendBatchResponse)
+async def send_batch(
+    batch: TransactionBatchSend,
+    idempotency_key: Optional[str] = Header(None, max_length=128),
+    user_id: str = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_db),
+    sender: SendQueue = Depends(get_sender)
+):
+    """Build, sign and broadcast many transfers from one wallet in a single call"""
+    if not batch.transfers:
+        raise HTTPException(status_code=400, detail="No transfers given")
+    if len(batch.transfers) > SEND_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SEND_BATCH_MAX} transfers per batch")
+
+    # Validate everything before anything is signed
+    transfers, errors = [], []
+    for index, item in enumerate(batch.transfers):
+        amount = round(item.amount * TOKEN_DECIMALS)
+        if amount <= 0:
+            errors.append({"index": index, "error": "Amount must be positive"})
+        elif not is_base58check_address(item.to_address):
+            errors.append({"index": index, "error": "Invalid destination address"})
+        transfers.append((item.to_address, "TRX" if item.token_type == "TRX" else "USDT", amount))
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    wallet_key = await load_wallet_key(db, user_id, batch.from_address)
+    if wallet_key is None:
+        raise HTTPException(status_code=404, detail="Wallet not found or access denied")
+
+    try:
+        jobs, created = await sender.send_batch(db, user_id, batch.from_address, wallet_key, transfers, idempotency_key)
+    except NodeBudgetExceeded:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error fetching transactions: {str(e)}")
+        if _is_failover_error(e, idempotent=True):
+            raise HTTPException(status_code=502, detail=f"TRON node unavailable, nothing was sent: {str(e) or type(e).__name__}")
+        raise HTTPException(status_code=400, detail=f"Batch failed: {str(e)}")
+    if not created and [(job.from_address, job.to_address, job.token, job.amount) for job in jobs] != [
+        (batch.from_address, *transfer) for transfer in transfers
+    ]:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different batch")
+
+    results = [serialize_send_job(job) for job in jobs]
+    return {
+        "from": batch.from_address,
+        "results": results,
+        "count": len(results),
+        "failed": sum(1 for r in results if r["status"] == "failed")
+    }
 
-# QR Code Generation
-@app.get("/qr/{address}", tags=["Utilities"])
-async def generate_qr_code(address: str):
-    """Generate QR code for receiving address"""
+@app.get("/send/{job_id}", tags=["Transactions"], response_model=SendJobResponse)
+async def get_send_job(job_id: str, user_id: str = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    """Status of a queued transfer"""
+    result = await db.execute(select(SendJob).where(
+        SendJob.id == job_id,
+        SendJob.user_id == user_id
+    ).limit(1))
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Send job not found")
+    return serialize_send_job(job)
+
+@app.get("/transactions/{address}", tags=["Transactions"], response_model=TransactionPage, response_model_exclude_unset=True, dependencies=[Depends(rate_limit)])
+async def get_transaction_history(
+    address: str,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    token: Optional[str] = Query(None, pattern="^(TRX|USDT)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma separated transaction fields to return, e.g. txid,amount,timestamp"),
+    db: AsyncSession = Depends(get_async_db),
+    history: TransactionHistory = Depends(get_history)
+):
+    """Get transaction history for an address, newest first, from the local store"""
+    selected = parse_fields(fields, TransactionItem)
+    if not is_base58check_address(address):
+        raise HTTPException(status_code=400, detail="Invalid TRON address")
+
+    # Only the first page pulls new transactions from the node; later pages are pure DB reads.
+    # `synced` is false if the node could not be reached or older history is still being backfilled.
+    if cursor is None:
+        try:
+            synced = await history.ensure_synced(address)
+        except Exception:
+            synced = False
+    else:
+        synced = await history.is_complete(db, address)
+
+    page_after = None
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if not row_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        page_after = (created_at, int(row_id))
+
+    transactions, has_more = await history.page(
+        db, address, limit,
+        cursor=page_after, token=token, start=to_naive_utc(start), end=to_naive_utc(end)
+    )
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(transactions[-1].block_timestamp, str(transactions[-1].id))
+
+    return {
+        "address": address,
+        "transactions": [project(serialize_transaction(tx), selected) for tx in transactions],
+        "count": len(transactions),
+        "next_cursor": next_cursor,
+        "synced": synced
+    }
+
+EXPORT_COLUMNS = ["txid", "token", "direction", "from", "to", "amount", "block_number", "timestamp", "status"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def encode_export_rows(rows: List[dict], fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, EXPORT_COLUMNS, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
+
+@app.get("/transactions/{address}/export", tags=["Transactions"], dependencies=[Depends(rate_limit)])
+async def export_transaction_history(
+    address: str,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    token: Optional[str] = Query(None, pattern="^(TRX|USDT)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    history: TransactionHistory = Depends(get_history)
+):
+    """Download every transfer of an address in [start, end), oldest first, as NDJSON or CSV"""
+    if not is_base58check_address(address):
+        raise HTTPException(status_code=400, detail="Invalid TRON address")
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    batches = history.export(address, [token] if token else TOKENS, start=start, end=end)
+    # Fetch the first page before answering so node errors still get a status code.
     try:
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(address)
-        qr.make(fit=True)
+        first = await anext(batches, [])
+    except Exception as e:
+        await batches.aclose()
+        if isinstance(e, NodeBudgetExceeded):
+            raise
+        raise HTTPException(status_code=502, detail=f"Error fetching transactions from the TRON node: {str(e) or type(e).__name__}")
+
+    async def body():
+        # A node error later on aborts the response, so a cut-off download never looks complete.
+        if fmt == "csv":
+            yield ",".join(EXPORT_COLUMNS).encode() + b"\n"
+        if first:
+            yield encode_export_rows(first, fmt)
+        async for rows in batches:
+            yield encode_export_rows(rows, fmt)
+
+    filename = f"{address}-transactions.{fmt}"
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-        img = qr.make_image(fill_color="black", back_color="white")
+@app.get("/events", tags=["Transactions"], dependencies=[Depends(rate_limit)])
+async def stream_events(
+    request: Request,
+    address: List[str] = Query(...),
+    watcher: BlockWatcher = Depends(get_watcher)
+):
+    """Server-sent events for incoming/outgoing transfers of the given addresses"""
+    addresses = list(dict.fromkeys(address))
+    if len(addresses) > EVENTS_MAX_ADDRESSES:
+        raise HTTPException(status_code=400, detail=f"At most {EVENTS_MAX_ADDRESSES} addresses per stream")
+    invalid = [a for a in addresses if not is_base58check_address(a)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid TRON address: {invalid[0]}")
+
+    queue = watcher.subscribe(addresses)
+
+    async def event_stream():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream.
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            watcher.unsubscribe(queue, addresses)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
+# QR Code Generation
+@app.get("/qr/{address}", tags=["Utilities"], dependencies=[Depends(rate_limit)])
+async def generate_qr_code(
+    address: str,
+    request: Request,
+    fmt: str = Query("json", alias="format", pattern="^(json|png|svg)$"),
+    box_size: int = Query(10, ge=1, le=40),
+    border: int = Query(5, ge=0, le=20),
+    qr: QRRenderer = Depends(get_qr)
+):
+    """Generate QR code for receiving address (JSON data URI, raw PNG or SVG)"""
+    image_format = "png" if fmt == "json" else fmt
+    etag = qr.etag(address, image_format, box_size, border)
+    headers = {"ETag": etag, "Cache-Control": QR_CACHE_CONTROL}
+
+    if fmt != "json" and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
 
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    try:
+        rendered = qr.lookup(address, image_format, box_size, border)
+        if rendered is None:
+            rendered = await run_blocking(qr.render, address, image_format, box_size, border)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error generating QR code: {str(e)}")
 
+    if fmt == "json":
+        img_base64 = base64.b64encode(rendered.content).decode()
         return {
             "address": address,
             "qr_code": f"data:image/png;base64,{img_base64}"
         }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error generating QR code: {str(e)}")
+
+    return Response(content=rendered.content, media_type=rendered.media_type, headers=headers)
 
 # Demo Mode
-@app.get("/demo/generate", tags=["Demo"])
-async def generate_demo(db: Session = Depends(get_db)):
+@app.get("/demo/generate", tags=["Demo"], response_model=DemoProfile, dependencies=[Depends(rate_limit)])
+async def generate_demo(db: AsyncSession = Depends(get_async_db)):
     """Generate a realistic demo profile"""
     profile = generate_demo_profile()
 
@@ -525,34 +1205,66 @@ async def generate_demo(db: Session = Depends(get_db)):
     )
 
     db.add(demo_record)
-    db.commit()
+    await db.commit()
 
     return profile
 
-@app.get("/demo/profile", tags=["Demo"])
+@app.get("/demo/profile", tags=["Demo"], response_model=DemoProfile, dependencies=[Depends(rate_limit)])
 async def get_demo_profile():
     """Get a new demo profile each time"""
     return generate_demo_profile()
 
 # Health check
 @app.get("/health", tags=["System"])
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db), tron: AsyncTronNodePool = Depends(get_tron), hasher: PasswordHasher = Depends(get_hasher), watcher: BlockWatcher = Depends(get_watcher), sender: SendQueue = Depends(get_sender)):
     """Check API and database health"""
     try:
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         return {
             "status": "healthy",
             "database": "connected",
-            "api": "running"
+            "api": "running",
+            "database_pool": pool_status(),
+            "tron_nodes": tron.status(),
+            "password_hashing": hasher.stats(),
+            "block_watcher": watcher.status(),
+            "send_queue": sender.stats()
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "database": "disconnected",
+            "database_pool": pool_status(),
             "error": str(e)
         }
 
-# Run the server
+@app.get("/metrics", tags=["System"])
+async def metrics(request: Request):
+    """Prometheus metrics: request/node latency, DB pool, bcrypt queue and cache hit ratios"""
+    state = request.app.state
+    caches = {
+        "balances": state.balances.cache.stats(),
+        "fee_resources": state.fees.resources.stats(),
+        "chain_params": state.fees.chain_params.stats(),
+        "contracts": state.tron.contract_info.stats(),
+        "history_syncs": state.history.stats(),
+        "qr": state.qr.cache.stats(),
+        "tokens": token_cache.stats(),
+        "revoked_tokens": revoked_tokens.stats(),
+        "private_keys": private_keys.stats(),
+        "hd_accounts": account_nodes.stats(),
+    }
+    families = pool_families(pool_status()) + hasher_families(state.hasher.stats()) + cache_families(caches)
+    families.append(Family("rate_limited_requests_total", "counter", "Requests rejected by the per-IP limiter.", [({}, client_limits.limited)]))
+    return Response(REGISTRY.render(families), media_type=METRICS_CONTENT_TYPE)
+
+# Run the server (development; production runs gunicorn with gunicorn.conf.py)
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Workers need an import string so each process builds its own app.
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "5000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
\ No newline at end of file
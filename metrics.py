@@ -0,0 +1,230 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated inline (request middleware, TRON node pool,
+password hasher). Point-in-time values such as pool usage and cache hit ratios
+are read from the app's services when ``/metrics`` is scraped. Each worker
+process keeps its own numbers.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cache hit on the event loop up to a node timing out.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Family(NamedTuple):
+    """A scrape-time metric: name, type, help text and ``(labels, value)`` samples."""
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [non-cumulative bucket counts (+Inf last), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        bounds = [_number(b) for b in self.buckets] + ["+Inf"]
+        for labelvalues, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, families: Iterable[Family] = ()) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for labels, value in family.samples:
+                lines.append(f"{family.name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time from request start until response headers are sent, by route template.",
+    ("method", "route", "status"),
+)
+TRON_RPC_DURATION = REGISTRY.histogram(
+    "tron_rpc_duration_seconds",
+    "Latency of TRON node calls, by method and node (failed attempts included).",
+    ("method", "node"),
+)
+TRON_RPC_ERRORS = REGISTRY.counter(
+    "tron_rpc_errors_total",
+    "Failed TRON node calls, by method, node and exception type.",
+    ("method", "node", "error"),
+)
+PASSWORD_HASH_QUEUE = REGISTRY.histogram(
+    "password_hash_queue_seconds",
+    "Time bcrypt hash/verify calls wait for a free worker slot.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording :data:`HTTP_REQUEST_DURATION`.
+
+    Routes are labelled by their template (``/wallets/{wallet_id}``), so the
+    series count stays bounded; unmatched paths share one label. Latency is
+    measured to the response start, which keeps streaming endpoints (SSE,
+    exports) from recording their whole connection time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            # Mounts (static files) have no route but set root_path to their prefix.
+            label = route.path if route is not None else scope.get("root_path") or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], label, str(status))
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            record(500)
+
+
+def cache_families(caches: Dict[str, dict]) -> List[Family]:
+    """Hit/miss counters, size and hit ratio from ``{name: cache.stats()}``."""
+    hits = Family("cache_hits_total", "counter", "Cache lookups served from memory.", [])
+    misses = Family("cache_misses_total", "counter", "Cache lookups that had to load.", [])
+    size = Family("cache_entries", "gauge", "Entries currently cached.", [])
+    ratio = Family("cache_hit_ratio", "gauge", "Hits / (hits + misses) since process start.", [])
+    for name, stats in caches.items():
+        labels = {"cache": name}
+        hits.samples.append((labels, stats["hits"]))
+        misses.samples.append((labels, stats["misses"]))
+        if stats["size"] is not None:  # unknown for shared caches
+            size.samples.append((labels, stats["size"]))
+        lookups = stats["hits"] + stats["misses"]
+        ratio.samples.append((labels, stats["hits"] / lookups if lookups else 0.0))
+    return [hits, misses, size, ratio]
+
+
+def pool_families(pools: Dict[str, dict]) -> List[Family]:
+    """Connection pool usage from :func:`database.pool_status`."""
+    families = {
+        "checkedout": Family("db_pool_checked_out", "gauge", "Connections currently in use.", []),
+        "checkedin": Family("db_pool_checked_in", "gauge", "Idle connections in the pool.", []),
+        "overflow": Family("db_pool_overflow", "gauge", "Connections opened beyond the pool size.", []),
+        "size": Family("db_pool_size", "gauge", "Configured pool size.", []),
+    }
+    for engine, stats in pools.items():
+        for key, family in families.items():
+            if key in stats:
+                family.samples.append(({"engine": engine}, stats[key]))
+    return [family for family in families.values() if family.samples]
+
+
+def hasher_families(stats: dict) -> List[Family]:
+    """Queue depth and throughput from :meth:`hashing.PasswordHasher.stats`."""
+    return [
+        Family("password_hash_queue_depth", "gauge", "bcrypt calls waiting for a worker slot.", [({}, stats["queue_depth"])]),
+        Family("password_hash_in_flight", "gauge", "bcrypt calls running.", [({}, stats["in_flight"])]),
+        Family("password_hash_completed_total", "counter", "bcrypt calls completed.", [({}, stats["completed"])]),
+    ]
+
@@ -0,0 +1,185 @@
+"""Schema migrations for the TRON Wallet API.
+
+Run once per deploy, before the web workers start:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied / pending migrations
+
+Applied versions are recorded in ``schema_migrations``. On PostgreSQL indexes are
+built with ``CREATE INDEX CONCURRENTLY`` so live tables are never write-locked, and
+an advisory lock keeps two deploys from migrating at the same time.
+"""
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from database import Base, SendJob, Transaction, TransactionSyncState, engine
+
+MIGRATION_LOCK_ID = 7_306_120_001
+
+
+class Migration(NamedTuple):
+    version: str
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _is_postgres(conn: Connection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+def create_index(conn: Connection, name: str, table: str, columns: List[str], unique: bool = False):
+    """Create an index without locking the table for writes (concurrently on PostgreSQL)."""
+    unique_sql = "UNIQUE " if unique else ""
+    column_sql = ", ".join(columns)
+    if _is_postgres(conn):
+        # A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS would skip.
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_sql})"))
+    else:
+        conn.execute(text(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({column_sql})"))
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """Add ``column`` (defined by ``ddl``) to ``table`` unless it already exists."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def drop_not_null(conn: Connection, table: str, column: str):
+    """Make ``column`` nullable (a catalog-only change on PostgreSQL)."""
+    columns = inspect(conn).get_columns(table)
+    if next(c for c in columns if c["name"] == column)["nullable"]:
+        return
+    if _is_postgres(conn):
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL"))
+        return
+    # SQLite cannot alter a column: rebuild the table from its model in one transaction.
+    names = ", ".join(c["name"] for c in columns)
+    conn.execute(text("BEGIN"))
+    try:
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+        for index in inspect(conn).get_indexes(f"{table}_old"):
+            conn.execute(text(f"DROP INDEX {index['name']}"))
+        Base.metadata.tables[table].create(bind=conn)
+        conn.execute(text(f"INSERT INTO {table} ({names}) SELECT {names} FROM {table}_old"))
+        conn.execute(text(f"DROP TABLE {table}_old"))
+        conn.execute(text("COMMIT"))
+    except BaseException:
+        conn.execute(text("ROLLBACK"))
+        raise
+
+
+# Migrations
+
+def _initial_schema(conn: Connection):
+    # Creates any missing tables from the models; existing tables are left untouched.
+    Base.metadata.create_all(bind=conn)
+
+
+def _wallet_lookup_indexes(conn: Connection):
+    create_index(conn, "ix_app_wallets_user_id_created_at", "app_wallets", ["user_id", "created_at"])
+    create_index(conn, "ix_app_wallets_user_id_address", "app_wallets", ["user_id", "address"])
+
+
+def _transaction_store(conn: Connection):
+    Base.metadata.create_all(bind=conn, tables=[Transaction.__table__, TransactionSyncState.__table__])
+
+
+def _send_jobs(conn: Connection):
+    Base.metadata.create_all(bind=conn, tables=[SendJob.__table__])
+
+
+def _hd_wallets(conn: Connection):
+    add_column(conn, "app_users", "hd_seed", "VARCHAR")
+    add_column(conn, "app_users", "hd_next_index", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "app_wallets", "derivation_index", "INTEGER")
+    drop_not_null(conn, "app_wallets", "private_key")
+    create_index(conn, "ix_app_wallets_user_id_derivation_index", "app_wallets", ["user_id", "derivation_index"], unique=True)
+
+
+def _history_backfill_gaps(conn: Connection):
+    for column in ("trx_gap_start", "trx_gap_end", "usdt_gap_start", "usdt_gap_end"):
+        add_column(conn, "app_tx_sync_state", column, "BIGINT")
+
+
+def _send_job_lease_owner(conn: Connection):
+    add_column(conn, "app_send_jobs", "locked_by", "VARCHAR")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration("0001", "initial schema", _initial_schema),
+    Migration("0002", "app_wallets (user_id, created_at) and (user_id, address) indexes", _wallet_lookup_indexes),
+    Migration("0003", "app_transactions and app_tx_sync_state", _transaction_store),
+    Migration("0004", "app_send_jobs", _send_jobs),
+    Migration("0005", "HD wallets: app_users.hd_seed/hd_next_index, app_wallets.derivation_index, nullable private_key", _hd_wallets),
+    Migration("0006", "app_tx_sync_state backfill gap columns", _history_backfill_gaps),
+    Migration("0007", "app_send_jobs.locked_by", _send_job_lease_owner),
+]
+
+
+# Runner
+
+def _ensure_version_table(conn: Connection):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _applied_versions(conn: Connection) -> set:
+    if not inspect(conn).has_table("schema_migrations"):
+        return set()
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_migrations() -> List[Migration]:
+    with engine.connect() as conn:
+        applied = _applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def migrate(log: Callable[[str], None] = print) -> List[str]:
+    """Apply pending migrations in order and return the versions applied."""
+    applied_now = []
+    # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if _is_postgres(conn):
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            _ensure_version_table(conn)
+            applied = _applied_versions(conn)
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+                log(f"Applying migration {migration.version}: {migration.description}")
+                migration.apply(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": migration.version, "d": migration.description, "t": datetime.utcnow()},
+                )
+                applied_now.append(migration.version)
+        finally:
+            if _is_postgres(conn):
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    if not applied_now:
+        log("Database schema is up to date")
+    return applied_now
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv[1:]:
+        pending = {m.version for m in pending_migrations()}
+        for m in MIGRATIONS:
+            print(f"{m.version}  {'pending' if m.version in pending else 'applied'}  {m.description}")
+    else:
+        migrate()
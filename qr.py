@@ -0,0 +1,69 @@
+import hashlib
+import os
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+from cache import ByteLRUCache
+
+# Configuration
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+class RenderedQR(NamedTuple):
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def _render(data: str, fmt: str, box_size: int, border: int) -> bytes:
+    # qrcode (and Pillow behind it) load on the first render, not at startup.
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRRenderer:
+    """Renders QR codes once per (data, format, size) and serves repeats from a byte-bounded LRU."""
+
+    def __init__(self, max_bytes: int = QR_CACHE_MAX_BYTES):
+        self.cache = ByteLRUCache(max_bytes)
+
+    @staticmethod
+    def etag(data: str, fmt: str, box_size: int, border: int) -> str:
+        # Content-addressed: the same inputs always render the same image.
+        digest = hashlib.sha256(f"{fmt}|{box_size}|{border}|{data}".encode()).hexdigest()[:32]
+        return f'"{digest}"'
+
+    def lookup(self, data: str, fmt: str = "png", box_size: int = 10, border: int = 5) -> Optional[RenderedQR]:
+        """Cached render, or ``None``; cheap enough to call on the event loop."""
+        etag = self.etag(data, fmt, box_size, border)
+        content = self.cache.get(etag)
+        if content is None:
+            return None
+        return RenderedQR(content, MEDIA_TYPES[fmt], etag)
+
+    def render(self, data: str, fmt: str = "png", box_size: int = 10, border: int = 5) -> RenderedQR:
+        """Render (CPU-bound, run it off the event loop) and cache the image."""
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported QR format '{fmt}'")
+        etag = self.etag(data, fmt, box_size, border)
+        content = self.cache.get(etag)
+        if content is None:
+            content = _render(data, fmt, box_size, border)
+            self.cache.set(etag, content)
+        return RenderedQR(content, MEDIA_TYPES[fmt], etag)
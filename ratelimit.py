@@ -0,0 +1,169 @@
+"""Token buckets shared on disk: per-client request limits and per-node call budgets.
+
+:class:`SharedTokenBuckets` keeps its buckets in a small SQLite file, so every
+uvicorn worker on the host draws from the same outbound budget per TRON node and
+:class:`ClientLimiter` holds each client IP to one request limit however many
+workers serve it.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Configuration
+# Requests per second per client IP on unauthenticated endpoints (0 disables), with bursts up to
+# RATE_LIMIT_BURST. Counted across all workers on the host, not per worker.
+RATE_LIMIT_PER_IP = float(os.getenv("RATE_LIMIT_PER_IP", "5"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+# Shared by all workers on the host; must be on a local filesystem.
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", os.path.join(tempfile.gettempdir(), "tron_wallet_budget.sqlite3"))
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + max(now - updated_at, 0.0) * rate)
+
+
+class SharedTokenBuckets:
+    """Token buckets stored in SQLite, shared by every process that opens ``path``.
+
+    :meth:`reserve` takes a token now if one is available, or books the next one
+    and says how long to wait for it, as long as that wait stays within
+    ``max_wait``. Each reservation is one short ``BEGIN IMMEDIATE`` transaction,
+    which can wait on other processes' locks, so async code calls
+    :meth:`reserve_async` to run it on the buckets' own thread.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_STORE):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Budget counters are disposable; skip fsync on every reservation.
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def reserve(self, key: str, rate: float, burst: float, max_wait: float = 0.0) -> Tuple[bool, float]:
+        """``(True, wait)`` if a token is booked after ``wait`` seconds, else ``(False, retry_after)``."""
+        if rate <= 0:
+            return True, 0.0
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(*row, now, rate, burst) if row else float(burst)
+                # Tokens may go negative: each booked call pushes the next one 1/rate further out.
+                wait = max(1 - tokens, 0.0) / rate
+                if wait > max_wait:
+                    conn.execute("ROLLBACK")
+                    return False, wait
+                conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens - 1, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return True, wait
+
+    def prune(self, prefix: str, rate: float, burst: float) -> int:
+        """Drop the buckets under ``prefix`` that have refilled; a missing bucket counts as full."""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "DELETE FROM token_buckets WHERE key LIKE ? AND updated_at + (? - tokens) / ? <= ?",
+                (f"{prefix}%", burst, rate, time.time()),
+            )
+        return cursor.rowcount
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self._executor is None:
+            # Reservations serialise on the connection anyway; one thread is all they can use,
+            # and a slow one cannot hold up the shared blocking pool.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-buckets")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def reserve_async(self, key: str, rate: float, burst: float, max_wait: float = 0.0) -> Tuple[bool, float]:
+        """:meth:`reserve` without blocking the event loop."""
+        if rate <= 0:
+            return True, 0.0
+        return await self._run(self.reserve, key, rate, burst, max_wait)
+
+    async def prune_async(self, prefix: str, rate: float, burst: float) -> int:
+        """:meth:`prune` without blocking the event loop."""
+        return await self._run(self.prune, prefix, rate, burst)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ClientLimiter:
+    """Token bucket per client IP, kept in :class:`SharedTokenBuckets` so it holds across workers.
+
+    Buckets live under ``ip:<host>`` next to the node budgets; refilled ones are
+    pruned from time to time so the file does not grow with every client seen.
+    A bucket store that cannot be reached lets the request through.
+    """
+
+    PREFIX = "ip:"
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_IP, burst: int = RATE_LIMIT_BURST, buckets: Optional[SharedTokenBuckets] = None):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = buckets or SharedTokenBuckets()
+        self.limited = 0
+        # An idle bucket is full again after burst / rate seconds.
+        self.prune_interval = max(burst / rate, 60.0) if rate > 0 else 0.0
+        self._pruned_at = time.monotonic()
+
+    async def acquire(self, host: str) -> float:
+        """Take a token for ``host``: 0 if allowed, else seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        try:
+            if time.monotonic() - self._pruned_at >= self.prune_interval:
+                self._pruned_at = time.monotonic()
+                await self.buckets.prune_async(self.PREFIX, self.rate, self.burst)
+            booked, wait = await self.buckets.reserve_async(f"{self.PREFIX}{host}", self.rate, self.burst)
+        except sqlite3.Error as e:
+            logger.warning("Per-IP rate limit store unavailable, letting the request through: %s", e)
+            return 0.0
+        if booked:
+            return 0.0
+        self.limited += 1
+        return wait
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "limited": self.limited}
+
+    def close(self):
+        self.buckets.close()
@@ -0,0 +1,604 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from balances import BalanceService
+from cache import SharedLease
+from database import SendJob
+from derivation import WalletKey, load_wallet_key, wallet_signing_key
+from executor import BLOCKING_POOL_SIZE, run_blocking
+from fees import FEE_LIMIT_MAX, FeeEstimator
+from tron_client import USDT_CONTRACT, AsyncTronNodePool, NodeBudgetExceeded, _is_failover_error
+from tx_history import TOKEN_DECIMALS
+
+if TYPE_CHECKING:
+    from tronpy import AsyncTron
+    from tronpy.async_tron import AsyncTransaction
+    from tronpy.keys import PrivateKey
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+# Retry delay is SEND_RETRY_BACKOFF * 2^(attempt - 1) seconds.
+SEND_RETRY_BACKOFF = float(os.getenv("SEND_RETRY_BACKOFF", "1"))
+# How long a worker owns a job before another worker (or process) may pick it up.
+SEND_LEASE_SECONDS = float(os.getenv("SEND_LEASE_SECONDS", "60"))
+SEND_CONFIRM_INTERVAL = float(os.getenv("SEND_CONFIRM_INTERVAL", "3"))
+SEND_CONFIRM_BATCH = int(os.getenv("SEND_CONFIRM_BATCH", "100"))
+SEND_CONFIRM_CONCURRENCY = int(os.getenv("SEND_CONFIRM_CONCURRENCY", "10"))
+# A broadcast transaction not found on chain after this long has expired (TRON expiry is 60s).
+SEND_CONFIRM_TIMEOUT = float(os.getenv("SEND_CONFIRM_TIMEOUT", "180"))
+# With CACHE_URL set, seconds before another process takes over confirmation and recovery.
+SEND_UPKEEP_LEASE_TTL = float(os.getenv("SEND_UPKEEP_LEASE_TTL", "15"))
+# Broadcasts in flight at once for POST /send/batch
+SEND_BATCH_CONCURRENCY = int(os.getenv("SEND_BATCH_CONCURRENCY", "20"))
+
+QUEUED, SIGNED, BROADCASTED, CONFIRMED, FAILED = "queued", "signed", "broadcasted", "confirmed", "failed"
+PENDING = (QUEUED, SIGNED)
+
+# Batch items are stored under ``batch:<Idempotency-Key>:<index>``; POST /send rejects
+# keys in this namespace so a single transfer can never match a batch item.
+BATCH_KEY_PREFIX = "batch:"
+
+# (locked_by, locked_until) of a claim; writes made under it only land while it is still current.
+Fence = Tuple[str, datetime]
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker claimed it; this worker must not touch it further."""
+
+
+def batch_item_key(idempotency_key: str, index: int) -> str:
+    return f"{BATCH_KEY_PREFIX}{idempotency_key}:{index}"
+
+
+def serialize(job: SendJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "transaction_id": job.txid,
+        "from": job.from_address,
+        "to": job.to_address,
+        "amount": job.amount / TOKEN_DECIMALS,
+        "token": job.token,
+        "attempts": job.attempts,
+        "error": job.error,
+        "block_number": job.block_number,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+def _is_duplicate(exc: Exception) -> bool:
+    # The node already has this exact transaction, i.e. an earlier attempt got through.
+    from tronpy.exceptions import UnknownError
+
+    return isinstance(exc, UnknownError) and len(exc.args) > 1 and exc.args[1] == "DUP_TRANSACTION_ERROR"
+
+
+async def build_transfer(
+    tron: AsyncTronNodePool,
+    client: "AsyncTron",
+    job: SendJob,
+    ref_block_id: Optional[str] = None,
+    fee_limit: int = FEE_LIMIT_MAX,
+) -> "AsyncTransaction":
+    """Unsigned transaction for ``job`` built against ``client``.
+
+    With ``ref_block_id`` the transaction is built offline (txid computed locally),
+    so building costs no node round trips beyond the cached contract ABI.
+    """
+    if job.token == "TRX":
+        builder = client.trx.transfer(job.from_address, job.to_address, job.amount).memo("TRON Wallet Transaction")
+    else:
+        contract = await tron.get_contract(client, USDT_CONTRACT)
+        builder = await contract.functions.transfer(job.to_address, job.amount)
+        builder = builder.with_owner(job.from_address).fee_limit(fee_limit)
+    if ref_block_id:
+        return await builder.build(offline=True, ref_block_id=ref_block_id)
+    return await builder.build()
+
+
+def _sign_all(txns: List["AsyncTransaction"], priv_key: "PrivateKey"):
+    for txn in txns:
+        txn.sign(priv_key)
+
+
+class SendQueue:
+    """Persistent send pipeline: enqueue, sign once, broadcast with retry, track confirmation.
+
+    Jobs live in ``app_send_jobs``; a worker claims one by taking a short lease on
+    the row, so several processes can share the table safely. Every write a
+    worker makes is fenced on its lease, so one whose lease ran out (a stalled
+    node call, a paused process) cannot overwrite the new holder's work. The
+    signed transaction is stored once, before the first broadcast, and every
+    broadcast sends that stored transaction, so a retry can never pay twice.
+
+    Receipt polling and lease recovery run only in the process holding the
+    ``send_upkeep`` lease (every process without ``CACHE_URL``); their status
+    updates only apply to jobs still ``broadcasted``.
+    """
+
+    def __init__(
+        self,
+        tron: AsyncTronNodePool,
+        balances: BalanceService,
+        fees: FeeEstimator,
+        session_factory,
+        workers: int = SEND_WORKERS,
+    ):
+        self.tron = tron
+        self.balances = balances
+        self.fees = fees
+        self.session_factory = session_factory
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._done: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Confirmation and recovery run in one process per deployment when CACHE_URL is set.
+        self.upkeep_lease = SharedLease("send_upkeep", ttl=max(SEND_UPKEEP_LEASE_TTL, 3 * SEND_CONFIRM_INTERVAL))
+
+    # Submission
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        from_address: str,
+        to_address: str,
+        token: str,
+        amount: int,
+        idempotency_key: Optional[str] = None,
+    ) -> Tuple[SendJob, bool]:
+        """Record and enqueue a transfer; returns ``(job, created)``.
+
+        A repeated ``idempotency_key`` returns the job created the first time.
+        """
+        if idempotency_key:
+            existing = await self._find_by_key(db, user_id, idempotency_key)
+            if existing is not None:
+                return existing, False
+
+        job = SendJob(
+            id=secrets.token_hex(8),
+            user_id=user_id,
+            idempotency_key=idempotency_key,
+            from_address=from_address,
+            to_address=to_address,
+            token=token,
+            amount=amount,
+            status=QUEUED,
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent request carrying the same key.
+            await db.rollback()
+            return await self._find_by_key(db, user_id, idempotency_key), False
+
+        self._done[job.id] = asyncio.Event()
+        self._queue.put_nowait(job.id)
+        return job, True
+
+    @staticmethod
+    async def _find_by_key(db: AsyncSession, user_id: str, idempotency_key: str) -> Optional[SendJob]:
+        result = await db.execute(select(SendJob).where(
+            SendJob.user_id == user_id,
+            SendJob.idempotency_key == idempotency_key
+        ).limit(1))
+        return result.scalars().first()
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """Wait until this process has broadcast (or given up on) ``job_id``."""
+        event = self._done.get(job_id)
+        if event is None:
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # Workers
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._confirm_loop()))
+        self._tasks.append(asyncio.create_task(self._recover_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.upkeep_lease.release()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.process(job_id)
+            except Exception:
+                logger.exception("Send job %s failed unexpectedly", job_id)
+
+    async def _claim(self, db: AsyncSession, job_id: str) -> Optional[Fence]:
+        now = datetime.utcnow()
+        fence = (secrets.token_hex(8), now + timedelta(seconds=SEND_LEASE_SECONDS))
+        result = await db.execute(
+            update(SendJob)
+            .where(
+                SendJob.id == job_id,
+                SendJob.status.in_(PENDING),
+                or_(SendJob.locked_until.is_(None), SendJob.locked_until < now)
+            )
+            .values(locked_by=fence[0], locked_until=fence[1])
+        )
+        await db.commit()
+        return fence if result.rowcount == 1 else None
+
+    @staticmethod
+    def _fenced(job_id: str, fence: Fence):
+        """UPDATE of ``job_id`` that only matches while ``fence`` still holds its lease."""
+        locked_by, locked_until = fence
+        return update(SendJob).where(
+            SendJob.id == job_id,
+            SendJob.locked_by == locked_by,
+            SendJob.locked_until == locked_until
+        )
+
+    async def process(self, job_id: str):
+        async with self.session_factory() as db:
+            fence = await self._claim(db, job_id)
+            if fence is None:
+                return
+            job = await db.get(SendJob, job_id)
+            # Detached: all writes go through fenced UPDATEs, never a blind ORM flush.
+            db.expunge(job)
+            retry_in = None
+            try:
+                if job.signed_tx is None:
+                    await self._sign(db, job, fence)
+                await self._broadcast(job)
+                job.status = BROADCASTED
+                job.broadcast_at = datetime.utcnow()
+                job.error = None
+                job.locked_until = None
+                await self.balances.invalidate(job.from_address)
+                await self.fees.invalidate(job.from_address)
+            except LeaseLost:
+                logger.warning("Send job %s was claimed by another worker; leaving it to them", job_id)
+                return
+            except Exception as e:
+                retry_in = self._record_failure(job, e)
+
+            saved = await self._save(db, job, fence)
+            await db.commit()
+            if not saved:
+                return
+
+        if retry_in is not None:
+            self._retry_later(job_id, retry_in)
+        if job.status not in PENDING:
+            event = self._done.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _save(self, db: AsyncSession, job: SendJob, fence: Fence) -> bool:
+        """Write the outcome of an attempt on ``job`` unless another worker has claimed it since."""
+        result = await db.execute(self._fenced(job.id, fence).values(
+            status=job.status,
+            error=job.error,
+            attempts=job.attempts,
+            broadcast_at=job.broadcast_at,
+            locked_until=job.locked_until,
+            locked_by=None
+        ))
+        if result.rowcount != 1:
+            logger.warning("Send job %s was claimed by another worker before its outcome was saved", job.id)
+            return False
+        return True
+
+    def _record_failure(self, job: SendJob, exc: Exception) -> Optional[float]:
+        """Mark ``job`` failed or due for retry; returns the retry delay, if any."""
+        job.error = str(exc) or type(exc).__name__
+        if isinstance(exc, NodeBudgetExceeded):
+            # Shed by our own budget before reaching the node; not a failed attempt.
+            job.locked_until = datetime.utcnow() + timedelta(seconds=exc.retry_after)
+            return exc.retry_after
+        job.attempts += 1
+        # Only node/network trouble is retried; rejections (bad balance, expiry, ...) are final.
+        if _is_failover_error(exc, idempotent=True) and job.attempts < SEND_MAX_ATTEMPTS:
+            delay = SEND_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.locked_until = datetime.utcnow() + timedelta(seconds=delay)
+            return delay
+        job.status = FAILED
+        job.locked_until = None
+        return None
+
+    def _retry_later(self, job_id: str, delay: float):
+        # Call only after the new lease is committed; re-enqueues just after it lapses
+        # so the claim in `process` succeeds.
+        asyncio.get_running_loop().call_later(delay + 0.1, self._queue.put_nowait, job_id)
+
+    async def _sign(self, db: AsyncSession, job: SendJob, fence: Fence):
+        wallet_key = await load_wallet_key(db, job.user_id, job.from_address)
+        if wallet_key is None:
+            raise ValueError("Wallet not found or access denied")
+
+        fee_limit = FEE_LIMIT_MAX
+        if job.token == "USDT":
+            fee_limit = await self.fees.fee_limit(job.from_address, job.to_address, job.amount)
+        txn = await self.tron.call(lambda client: build_transfer(self.tron, client, job, fee_limit=fee_limit), method="build")
+        with wallet_signing_key(wallet_key) as priv_key:
+            txn.sign(priv_key)
+        signed_tx = json.dumps(txn.to_json())
+        # Persist the signature before broadcasting so every retry sends the same transaction.
+        # Only the current lease holder may store it, and only once: a worker whose lease
+        # lapsed mid-signing must not broadcast a second, different transaction.
+        result = await db.execute(
+            self._fenced(job.id, fence)
+            .where(SendJob.signed_tx.is_(None))
+            .values(signed_tx=signed_tx, txid=txn.txid, status=SIGNED)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            raise LeaseLost(job.id)
+        job.signed_tx = signed_tx
+        job.txid = txn.txid
+        job.status = SIGNED
+
+    async def _broadcast(self, job: SendJob):
+        payload = json.loads(job.signed_tx)
+
+        from tronpy.async_tron import AsyncTransaction
+
+        async def broadcast(client: "AsyncTron"):
+            txn = await AsyncTransaction.from_json(payload, client=client)
+            return await client.broadcast(txn)
+
+        try:
+            await self.tron.call(broadcast, idempotent=True, method="broadcast")
+        except Exception as e:
+            if not _is_duplicate(e):
+                raise
+
+    # Batches
+
+    async def send_batch(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        from_address: str,
+        wallet_key: WalletKey,
+        transfers: List[Tuple[str, str, int]],
+        idempotency_key: Optional[str] = None,
+        concurrency: int = SEND_BATCH_CONCURRENCY,
+    ) -> Tuple[List[SendJob], bool]:
+        """Build, sign and broadcast many ``(to_address, token, amount)`` transfers from one wallet.
+
+        Returns ``(jobs, created)``; a repeated ``idempotency_key`` returns the
+        jobs created the first time. The reference block is fetched once and
+        every transaction is built offline against it, signing runs off the
+        event loop, and broadcasts go out at most ``concurrency`` at a time.
+        Items whose broadcast hits a node error are left signed and handed to the
+        worker pool for retry.
+        """
+        item_keys = [batch_item_key(idempotency_key, index) for index in range(len(transfers))] if idempotency_key else None
+        if item_keys:
+            existing = await self._find_batch(db, user_id, idempotency_key, len(transfers))
+            if existing:
+                return existing, False
+
+        fence = (secrets.token_hex(8), datetime.utcnow() + timedelta(seconds=SEND_LEASE_SECONDS))
+        jobs = [
+            SendJob(
+                id=secrets.token_hex(8),
+                user_id=user_id,
+                idempotency_key=item_keys[index] if item_keys else None,
+                from_address=from_address,
+                to_address=to_address,
+                token=token,
+                amount=amount,
+                status=QUEUED,
+                locked_by=fence[0],
+                locked_until=fence[1],
+            )
+            for index, (to_address, token, amount) in enumerate(transfers)
+        ]
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # One simulation per USDT recipient: the energy depends on whether the recipient
+        # already holds USDT, not on the amount, so its largest amount stands for all.
+        recipients: Dict[str, int] = {}
+        for job in jobs:
+            if job.token == "USDT":
+                recipients[job.to_address] = max(recipients.get(job.to_address, 0), job.amount)
+
+        async def fee_limit(to_address: str, amount: int) -> int:
+            async with semaphore:
+                return await self.fees.fee_limit(from_address, to_address, amount)
+
+        limits = dict(zip(recipients, await asyncio.gather(*(
+            fee_limit(to_address, amount) for to_address, amount in recipients.items()
+        ))))
+        fee_limits = [limits[job.to_address] if job.token == "USDT" else FEE_LIMIT_MAX for job in jobs]
+
+        async def build_all(client: "AsyncTron") -> List["AsyncTransaction"]:
+            ref_block_id = await client.get_latest_solid_block_id()
+            return [
+                await build_transfer(self.tron, client, job, ref_block_id, limit)
+                for job, limit in zip(jobs, fee_limits)
+            ]
+
+        txns = await self.tron.call(build_all, method="build_batch")
+        chunk = -(-len(txns) // BLOCKING_POOL_SIZE)
+        with wallet_signing_key(wallet_key) as priv_key:
+            await asyncio.gather(*(
+                run_blocking(_sign_all, txns[i:i + chunk], priv_key) for i in range(0, len(txns), chunk)
+            ))
+        for job, txn in zip(jobs, txns):
+            job.signed_tx = json.dumps(txn.to_json())
+            job.txid = txn.txid
+            job.status = SIGNED
+        db.add_all(jobs)
+        # Signed transactions are stored before any broadcast, as in `process`.
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent batch carrying the same key; nothing was broadcast.
+            await db.rollback()
+            return await self._find_batch(db, user_id, idempotency_key, len(transfers)), False
+        for job in jobs:
+            db.expunge(job)
+
+        retries: Dict[str, float] = {}
+
+        async def broadcast(job: SendJob):
+            async with semaphore:
+                try:
+                    await self._broadcast(job)
+                except Exception as e:
+                    delay = self._record_failure(job, e)
+                    if delay is not None:
+                        retries[job.id] = delay
+                    return
+            job.status = BROADCASTED
+            job.broadcast_at = datetime.utcnow()
+            job.locked_until = None
+
+        await asyncio.gather(*(broadcast(job) for job in jobs))
+        await self.balances.invalidate(from_address)
+        await self.fees.invalidate(from_address)
+        # Fenced as in `process`: a job the recovery loop re-claimed meanwhile is left to it.
+        saved = {job.id for job in jobs if await self._save(db, job, fence)}
+        await db.commit()
+        for job_id, delay in retries.items():
+            if job_id in saved:
+                self._retry_later(job_id, delay)
+        return jobs, True
+
+    @staticmethod
+    async def _find_batch(db: AsyncSession, user_id: str, idempotency_key: str, count: int) -> List[SendJob]:
+        # One key past ``count`` too, so a longer batch stored under the same key never
+        # matches a shorter request.
+        item_keys = [batch_item_key(idempotency_key, index) for index in range(count + 1)]
+        result = await db.execute(
+            select(SendJob).where(SendJob.user_id == user_id, SendJob.idempotency_key.in_(item_keys))
+        )
+        existing = {job.idempotency_key: job for job in result.scalars().all()}
+        return [existing[key] for key in item_keys if key in existing]
+
+    # Recovery and confirmation
+
+    async def _recover_loop(self):
+        """Re-enqueue pending jobs whose lease ran out (crashed worker, restart, other process)."""
+        while True:
+            try:
+                if not await self.upkeep_lease.acquire():
+                    await asyncio.sleep(SEND_LEASE_SECONDS)
+                    continue
+                async with self.session_factory() as db:
+                    result = await db.execute(
+                        select(SendJob.id)
+                        .where(
+                            SendJob.status.in_(PENDING),
+                            or_(SendJob.locked_until.is_(None), SendJob.locked_until < datetime.utcnow())
+                        )
+                        .limit(SEND_CONFIRM_BATCH)
+                    )
+                    for job_id in result.scalars().all():
+                        self._queue.put_nowait(job_id)
+            except Exception:
+                logger.exception("Send job recovery failed")
+            await asyncio.sleep(SEND_LEASE_SECONDS)
+
+    async def _confirm_loop(self):
+        while True:
+            try:
+                # Also renews the lease for _recover_loop, which sleeps far longer than its TTL.
+                if await self.upkeep_lease.acquire():
+                    await self.confirm_pending()
+            except Exception:
+                logger.exception("Send confirmation check failed")
+            await asyncio.sleep(SEND_CONFIRM_INTERVAL)
+
+    async def confirm_pending(self) -> int:
+        """Check receipts for a batch of broadcast jobs; returns how many reached a final state."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(SendJob)
+                .where(SendJob.status == BROADCASTED)
+                .order_by(SendJob.broadcast_at)
+                .limit(SEND_CONFIRM_BATCH)
+            )
+            jobs = result.scalars().all()
+            if not jobs:
+                return 0
+
+            from tronpy.exceptions import TransactionNotFound
+
+            semaphore = asyncio.Semaphore(SEND_CONFIRM_CONCURRENCY)
+
+            async def receipt(job: SendJob) -> Optional[dict]:
+                async with semaphore:
+                    try:
+                        return await self.tron.call(
+                            lambda client: client.get_transaction_info(job.txid), method="get_transaction_info"
+                        )
+                    except TransactionNotFound:
+                        return None
+
+            receipts = await asyncio.gather(*(receipt(job) for job in jobs), return_exceptions=True)
+
+            # Outcomes are written with UPDATE ... WHERE status = 'broadcasted', never a blind
+            # ORM flush, so a job another process has already settled is left alone.
+            db.expunge_all()
+            finished = 0
+            now = datetime.utcnow()
+            for job, info in zip(jobs, receipts):
+                if isinstance(info, Exception):
+                    continue
+                if info is None:
+                    if not job.broadcast_at or (now - job.broadcast_at).total_seconds() <= SEND_CONFIRM_TIMEOUT:
+                        continue
+                    values = {"status": FAILED, "error": "Transaction not found on chain before expiration"}
+                else:
+                    contract_result = (info.get("receipt") or {}).get("result", "SUCCESS")
+                    if info.get("result") == "FAILED" or contract_result != "SUCCESS":
+                        values = {"status": FAILED, "error": info.get("resMessage") or contract_result}
+                    else:
+                        values = {"status": CONFIRMED}
+                    values["block_number"] = info.get("blockNumber")
+                result = await db.execute(
+                    update(SendJob).where(SendJob.id == job.id, SendJob.status == BROADCASTED).values(**values)
+                )
+                if result.rowcount != 1:
+                    continue
+                for name, value in values.items():
+                    setattr(job, name, value)
+                if info is not None:
+                    await self.balances.invalidate(job.from_address)
+                finished += 1
+            await db.commit()
+            return finished
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": any(not task.done() for task in self._tasks),
+        }
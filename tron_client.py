@@ -0,0 +1,292 @@
+import asyncio
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List, Optional, Tuple, TypeVar
+from urllib.parse import urljoin
+
+import httpx
+
+from cache import cache_backend
+from metrics import TRON_RPC_DURATION, TRON_RPC_ERRORS
+from ratelimit import SharedTokenBuckets
+
+if TYPE_CHECKING:
+    from tronpy import AsyncTron
+    from tronpy.async_contract import AsyncContract
+
+T = TypeVar("T")
+
+# Configuration
+TRON_NETWORK = os.getenv("TRON_NETWORK", "mainnet")
+# Comma separated full-node URLs, each optionally suffixed with "|<timeout seconds>" and
+# "|<calls per second>", e.g. "https://api.trongrid.io|5|15,http://10.0.0.5:8090|2|0".
+# Defaults to the network's public node.
+TRON_NODE_URLS = os.getenv("TRON_NODE_URLS", "")
+TRON_NODE_TIMEOUT = float(os.getenv("TRON_NODE_TIMEOUT", "10"))
+# Outbound budget per node across all workers on the host (0 = unlimited). Calls over
+# budget wait up to TRON_NODE_MAX_WAIT seconds for a slot, then fail with NodeBudgetExceeded.
+TRON_NODE_RATE = float(os.getenv("TRON_NODE_RATE", "15"))
+TRON_NODE_BURST = float(os.getenv("TRON_NODE_BURST", "30"))
+TRON_NODE_MAX_WAIT = float(os.getenv("TRON_NODE_MAX_WAIT", "2"))
+TRON_API_KEY = os.getenv("TRON_API_KEY")
+TRON_POOL_MAXSIZE = int(os.getenv("TRON_POOL_MAXSIZE", "20"))
+TRON_NODE_MAX_FAILURES = int(os.getenv("TRON_NODE_MAX_FAILURES", "3"))
+TRON_NODE_COOLDOWN = float(os.getenv("TRON_NODE_COOLDOWN", "30"))
+MAINNET_FULLNODE = "https://api.trongrid.io"
+USDT_CONTRACT = os.getenv("USDT_CONTRACT", "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t")  # USDT-TRC20 mainnet
+# Seconds a downloaded contract ABI is reused (by all workers if CACHE_URL is set)
+CONTRACT_CACHE_TTL = float(os.getenv("CONTRACT_CACHE_TTL", "86400"))
+
+
+class NodeBudgetExceeded(Exception):
+    """Every node is over its call budget for longer than the caller may wait."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"TRON node call budget exhausted; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class NodeEndpoint:
+    """A single full-node URL with its timeout, call budget and health state."""
+
+    def __init__(self, url: str, timeout: float, rate: float = TRON_NODE_RATE):
+        self.url = url
+        self.timeout = timeout
+        self.rate = rate
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.unhealthy_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= TRON_NODE_MAX_FAILURES:
+                self.unhealthy_until = time.monotonic() + TRON_NODE_COOLDOWN
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "timeout": self.timeout,
+            "rate": self.rate,
+            "healthy": self.healthy,
+            "failures": self.failures,
+        }
+
+
+def parse_node_urls(value: str, network: str = TRON_NETWORK, default_timeout: float = TRON_NODE_TIMEOUT) -> List[NodeEndpoint]:
+    """Parse ``TRON_NODE_URLS`` into endpoints, falling back to the network default node."""
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, options = item.partition("|")
+        timeout, _, rate = options.partition("|")
+        endpoints.append(NodeEndpoint(
+            url.strip(),
+            float(timeout) if timeout else default_timeout,
+            float(rate) if rate else TRON_NODE_RATE,
+        ))
+
+    if not endpoints:
+        if network == "mainnet":
+            # Same as tronpy's mainnet default; spelled out so startup does not import tronpy.
+            fullnode = MAINNET_FULLNODE
+        else:
+            from tronpy.defaults import conf_for_name
+
+            conf = conf_for_name(network)
+            if conf is None:
+                raise ValueError(f"Unknown TRON_NETWORK '{network}' and no TRON_NODE_URLS configured")
+            fullnode = conf["fullnode"]
+        endpoints.append(NodeEndpoint(fullnode, default_timeout))
+    return endpoints
+
+
+def is_base58check_address(value: str) -> bool:
+    """``tronpy.keys.is_base58check_address``, importing tronpy on first use."""
+    from tronpy.keys import is_base58check_address as check
+
+    return check(value)
+
+
+def _is_failover_error(exc: Exception, idempotent: bool) -> bool:
+    """Whether an error means the node (not the request) is at fault."""
+    # The request never reached the node, so any call is safe to retry elsewhere.
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if not idempotent:
+        return False
+    if isinstance(exc, (httpx.TimeoutException, httpx.RemoteProtocolError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+def _record_call(method: str, endpoint: NodeEndpoint, start: float, error: Optional[Exception] = None):
+    TRON_RPC_DURATION.observe(time.perf_counter() - start, method, endpoint.url)
+    if error is not None:
+        TRON_RPC_ERRORS.inc(method, endpoint.url, type(error).__name__)
+
+
+class AsyncTronNodePool:
+    """App-scoped pool of ``AsyncTron`` clients with health-aware failover.
+
+    Each endpoint shares one ``httpx.AsyncClient`` so connections stay alive across
+    requests and a slow node only delays the coroutines waiting on it. Calls go to
+    the first healthy endpoint; an endpoint that fails ``TRON_NODE_MAX_FAILURES``
+    times in a row is skipped for ``TRON_NODE_COOLDOWN`` seconds.
+
+    Clients are built on first use, so importing and constructing a pool stays cheap
+    and ``tronpy`` is only loaded once something actually talks to a node.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[NodeEndpoint],
+        api_key: Optional[str] = None,
+        pool_maxsize: int = TRON_POOL_MAXSIZE,
+        budget: Optional[SharedTokenBuckets] = None,
+        max_wait: float = TRON_NODE_MAX_WAIT,
+    ):
+        if not endpoints:
+            raise ValueError("At least one TRON node endpoint is required")
+        self.endpoints = endpoints
+        self.budget = budget
+        self.max_wait = max_wait
+        self.api_key = api_key
+        self.limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+        # ABI and metadata by contract address; contracts bound to a node's client by (node, address).
+        self.contract_info = cache_backend("contracts", maxsize=100, ttl=CONTRACT_CACHE_TTL)
+        self._contracts = {}
+        self._clients = {}
+
+    async def _reserve(self, endpoint: NodeEndpoint, method: str) -> Tuple[bool, float]:
+        """Book a call to ``endpoint``: ``(True, wait)`` or ``(False, retry_after)`` when over budget."""
+        if self.budget is None:
+            return True, 0.0
+        booked, wait = await self.budget.reserve_async(endpoint.url, endpoint.rate, TRON_NODE_BURST, self.max_wait)
+        if not booked:
+            TRON_RPC_ERRORS.inc(method, endpoint.url, NodeBudgetExceeded.__name__)
+        return booked, wait
+
+    def _client_for(self, endpoint: NodeEndpoint) -> "AsyncTron":
+        client = self._clients.get(endpoint.url)
+        if client is None:
+            client = self._clients[endpoint.url] = self._make_client(endpoint)
+        return client
+
+    def _ordered_endpoints(self) -> List[NodeEndpoint]:
+        healthy = [e for e in self.endpoints if e.healthy]
+        # When every node is cooling down, still try them rather than fail outright.
+        return healthy or list(self.endpoints)
+
+    @property
+    def client(self) -> "AsyncTron":
+        """Client for the preferred endpoint, for local-only helpers such as address generation."""
+        return self._client_for(self._ordered_endpoints()[0])
+
+    def status(self) -> List[dict]:
+        return [endpoint.status() for endpoint in self.endpoints]
+
+    def _make_client(self, endpoint: NodeEndpoint) -> "AsyncTron":
+        from tronpy import AsyncTron
+        from tronpy.providers.async_http import AsyncHTTPProvider
+
+        http_client = httpx.AsyncClient(timeout=httpx.Timeout(endpoint.timeout), limits=self.limits)
+        provider = AsyncHTTPProvider(endpoint.url, timeout=endpoint.timeout, client=http_client, api_key=self.api_key)
+        return AsyncTron(provider=provider)
+
+    @classmethod
+    def from_env(cls) -> "AsyncTronNodePool":
+        return cls(parse_node_urls(TRON_NODE_URLS), api_key=TRON_API_KEY, budget=SharedTokenBuckets())
+
+    async def call(self, fn: Callable[["AsyncTron"], Awaitable[T]], idempotent: bool = True, method: str = "other") -> T:
+        """Await ``fn(client)`` against the first healthy endpoint, failing over on node errors.
+
+        Non-idempotent calls (e.g. broadcasts) only fail over when the connection
+        could not be established, so a transaction is never sent twice. ``method``
+        labels the call's latency and error metrics.
+
+        An endpoint over its call budget is skipped; if all are, the call waits up to
+        ``max_wait`` for a slot and otherwise raises :class:`NodeBudgetExceeded`.
+        """
+        last_error, retry_after = None, None
+        for endpoint in self._ordered_endpoints():
+            booked, wait = await self._reserve(endpoint, method)
+            if not booked:
+                retry_after = wait if retry_after is None else min(retry_after, wait)
+                continue
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.perf_counter()
+            try:
+                result = await fn(self._client_for(endpoint))
+            except Exception as e:
+                _record_call(method, endpoint, start, e)
+                if not _is_failover_error(e, idempotent):
+                    raise
+                endpoint.record_failure()
+                last_error = e
+                continue
+            _record_call(method, endpoint, start)
+            endpoint.record_success()
+            return result
+        if retry_after is not None:
+            raise NodeBudgetExceeded(retry_after)
+        raise last_error
+
+    async def get_contract(self, client: "AsyncTron", addr: str) -> "AsyncContract":
+        """Contract bound to ``client``; the ABI is downloaded once and reused for every node."""
+        from tronpy.async_contract import AsyncContract
+
+        key = (client.provider.endpoint_uri, addr)
+        contract = self._contracts.get(key)
+        if contract is None:
+            info = await self.contract_info.get_or_load(addr, lambda: self._contract_info(client, addr))
+            contract = AsyncContract(addr, client=client, **info)
+            self._contracts[key] = contract
+        return contract
+
+    @staticmethod
+    async def _contract_info(client: "AsyncTron", addr: str) -> dict:
+        # Everything but the bytecode, which calls and transfers never need.
+        contract = await client.get_contract(addr)
+        return {
+            "name": contract.name,
+            "abi": contract.abi,
+            "user_resource_percent": contract.user_resource_percent,
+            "origin_energy_limit": contract.origin_energy_limit,
+            "origin_address": contract.origin_address,
+            "code_hash": contract.code_hash,
+        }
+
+    async def get_json(self, path: str, params: Optional[dict] = None, method: str = "get_json") -> Any:
+        """GET a TronGrid-style REST path (e.g. ``v1/accounts/...``) from the node."""
+        async def _get(client: "AsyncTron"):
+            provider = client.provider
+            headers = {}
+            if provider.use_api_key:
+                headers["TRON-PRO-API-KEY"] = provider.random_api_key
+            resp = await provider.client.get(urljoin(provider.endpoint_uri, path), params=params, headers=headers)
+            resp.raise_for_status()
+            return resp.json()
+
+        return await self.call(_get, method=method)
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        if self.budget is not None:
+            self.budget.close()
@@ -0,0 +1,342 @@
+import heapq
+import os
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import cache_backend
+from database import Transaction, TransactionSyncState
+from tron_client import USDT_CONTRACT, AsyncTronNodePool
+
+# Configuration
+TX_SYNC_INTERVAL = float(os.getenv("TX_SYNC_INTERVAL", "15"))
+TX_SYNC_PAGE_SIZE = int(os.getenv("TX_SYNC_PAGE_SIZE", "200"))
+# Pages fetched per sync; a long backlog is caught up over several requests.
+TX_SYNC_MAX_PAGES = int(os.getenv("TX_SYNC_MAX_PAGES", "5"))
+
+TOKENS = ("TRX", "USDT")
+TOKEN_DECIMALS = 1_000_000
+
+
+def _to_base58(addr: Optional[str]) -> Optional[str]:
+    if not addr:
+        return addr
+    from tronpy import keys
+
+    try:
+        return keys.to_base58check_address(addr)
+    except Exception:
+        return addr
+
+
+def parse_trx_transfers(address: str, data: List[dict]) -> Iterator[dict]:
+    """TRX transfers (TransferContract) from a TronGrid ``/v1/accounts/{address}/transactions`` page."""
+    for tx in data:
+        contracts = tx.get("raw_data", {}).get("contract") or []
+        if not contracts or contracts[0].get("type") != "TransferContract":
+            continue
+        value = contracts[0]["parameter"]["value"]
+        from_address = _to_base58(value.get("owner_address"))
+        to_address = _to_base58(value.get("to_address"))
+        yield {
+            "address": address,
+            "txid": tx["txID"],
+            "token": "TRX",
+            "direction": "in" if to_address == address and from_address != address else "out",
+            "from_address": from_address,
+            "to_address": to_address,
+            "amount": int(value.get("amount", 0)),
+            "block_number": tx.get("blockNumber"),
+            "block_timestamp": tx["block_timestamp"],
+            "status": (tx.get("ret") or [{}])[0].get("contractRet"),
+        }
+
+
+def parse_usdt_transfers(address: str, data: List[dict]) -> Iterator[dict]:
+    """USDT transfers from a TronGrid ``/v1/accounts/{address}/transactions/trc20`` page."""
+    for tx in data:
+        if tx.get("type", "Transfer") != "Transfer":
+            continue
+        from_address = tx.get("from")
+        to_address = tx.get("to")
+        yield {
+            "address": address,
+            "txid": tx["transaction_id"],
+            "token": "USDT",
+            "direction": "in" if to_address == address and from_address != address else "out",
+            "from_address": from_address,
+            "to_address": to_address,
+            "amount": int(tx.get("value", 0)),
+            "block_number": None,
+            "block_timestamp": tx["block_timestamp"],
+            "status": "SUCCESS",
+        }
+
+
+SOURCES: Dict[str, Tuple[str, dict, Callable[[str, List[dict]], Iterator[dict]]]] = {
+    "TRX": ("v1/accounts/{address}/transactions", {}, parse_trx_transfers),
+    "USDT": ("v1/accounts/{address}/transactions/trc20", {"contract_address": USDT_CONTRACT}, parse_usdt_transfers),
+}
+
+
+def serialize(tx: Transaction) -> dict:
+    return {
+        "txid": tx.txid,
+        "token": tx.token,
+        "direction": tx.direction,
+        "from": tx.from_address,
+        "to": tx.to_address,
+        "amount": tx.amount / TOKEN_DECIMALS,
+        "block_number": tx.block_number,
+        "timestamp": tx.block_timestamp.isoformat(),
+        "status": tx.status,
+    }
+
+
+def serialize_transfer(row: dict) -> dict:
+    """:func:`serialize` for a parsed node row that was never stored."""
+    return {
+        "txid": row["txid"],
+        "token": row["token"],
+        "direction": row["direction"],
+        "from": row["from_address"],
+        "to": row["to_address"],
+        "amount": row["amount"] / TOKEN_DECIMALS,
+        "block_number": row["block_number"],
+        "timestamp": datetime.utcfromtimestamp(row["block_timestamp"] / 1000).isoformat(),
+        "status": row["status"],
+    }
+
+
+def _epoch_ms(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class TransactionHistory:
+    """Local, incrementally synced transaction store per address.
+
+    Each sync pages the node newest first, down to the newest block timestamp
+    already stored (per token), following TronGrid fingerprints. A sync fetches
+    at most ``TX_SYNC_MAX_PAGES`` pages per token; if that is not enough to reach
+    the stored transfers (a new or long idle address), the rest is recorded as a
+    gap and backfilled, newest first, by the following syncs. So the latest
+    transfers are always stored first. Duplicates from overlapping timestamps are
+    ignored on insert.
+    """
+
+    def __init__(self, tron: AsyncTronNodePool, session_factory, sync_interval: float = TX_SYNC_INTERVAL):
+        self.tron = tron
+        self.session_factory = session_factory
+        # Addresses synced within the last `sync_interval` seconds (by any worker if shared);
+        # also merges concurrent syncs in this process.
+        self._recent_syncs = cache_backend("history_syncs", maxsize=100_000, ttl=sync_interval)
+
+    async def ensure_synced(self, address: str) -> bool:
+        """Sync ``address`` unless it was synced recently; False while older history is missing."""
+        complete = await self._recent_syncs.get_or_load(address, lambda: self.sync(address))
+        if not complete:
+            # Keep backfilling on the next request instead of waiting out the interval.
+            await self._recent_syncs.delete(address)
+        return complete
+
+    async def invalidate(self, address: str):
+        """Make the next first-page request for ``address`` sync immediately."""
+        await self._recent_syncs.delete(address)
+
+    def stats(self) -> dict:
+        """Hit/miss counts of the recent-sync cache (a hit skips a node round trip)."""
+        return self._recent_syncs.stats()
+
+    @staticmethod
+    async def is_complete(db: AsyncSession, address: str) -> bool:
+        """Whether no older history of ``address`` is left to backfill."""
+        state = await db.get(TransactionSyncState, address)
+        return state is None or all(getattr(state, f"{token.lower()}_gap_end") is None for token in TOKENS)
+
+    async def sync(self, address: str) -> bool:
+        """Fetch and store new transfers for ``address``; returns whether its history is complete."""
+        async with self.session_factory() as db:
+            state = await db.get(TransactionSyncState, address)
+            if state is None:
+                state = TransactionSyncState(address=address, trx_last_timestamp=0, usdt_last_timestamp=0)
+                db.add(state)
+
+            complete = True
+            for token in TOKENS:
+                complete &= await self._sync_token(db, state, address, token)
+
+            state.synced_at = datetime.utcnow()
+            await db.commit()
+        return complete
+
+    async def _sync_token(self, db: AsyncSession, state: TransactionSyncState, address: str, token: str) -> bool:
+        prefix = token.lower()
+        last = getattr(state, f"{prefix}_last_timestamp") or 0
+        gap_start, gap_end = getattr(state, f"{prefix}_gap_start"), getattr(state, f"{prefix}_gap_end")
+
+        # Newest first, from now down to the newest stored transfer.
+        rows, newest, oldest, reached, pages = await self._fetch_newest_first(address, token, last, None, TX_SYNC_MAX_PAGES)
+        await self._insert_ignore(db, rows)
+        if not reached:
+            # Out of pages before meeting stored history; an existing gap lies below and merges in.
+            gap_start, gap_end = last if gap_start is None else gap_start, oldest
+        setattr(state, f"{prefix}_last_timestamp", max(last, newest))
+
+        # Then continue down the gap with whatever pages are left.
+        if reached and gap_end is not None and pages < TX_SYNC_MAX_PAGES:
+            rows, _, oldest, reached, _ = await self._fetch_newest_first(
+                address, token, gap_start, gap_end, TX_SYNC_MAX_PAGES - pages
+            )
+            await self._insert_ignore(db, rows)
+            gap_start, gap_end = (None, None) if reached else (gap_start, oldest)
+
+        setattr(state, f"{prefix}_gap_start", gap_start)
+        setattr(state, f"{prefix}_gap_end", gap_end)
+        return gap_end is None
+
+    async def _node_pages(
+        self,
+        address: str,
+        token: str,
+        min_timestamp: int,
+        max_timestamp: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> AsyncIterator[Tuple[List[dict], bool]]:
+        """Raw ``data`` of successive TronGrid pages following fingerprints, each with
+        whether more pages follow. Timestamp bounds are inclusive."""
+        path, extra_params, _ = SOURCES[token]
+        params = {
+            "only_confirmed": "true",
+            "limit": TX_SYNC_PAGE_SIZE,
+            "order_by": "block_timestamp,desc" if newest_first else "block_timestamp,asc",
+            "min_timestamp": min_timestamp,
+            **extra_params,
+        }
+        if max_timestamp is not None:
+            params["max_timestamp"] = max_timestamp
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            page = await self.tron.get_json(path.format(address=address), params, method=f"{token.lower()}_transactions")
+            pages += 1
+            data = page.get("data", [])
+            fingerprint = (page.get("meta") or {}).get("fingerprint")
+            more = bool(fingerprint and data)
+            yield data, more
+            if not more:
+                return
+            params["fingerprint"] = fingerprint
+
+    async def _fetch_newest_first(
+        self, address: str, token: str, min_timestamp: int, max_timestamp: Optional[int], max_pages: int
+    ) -> Tuple[List[dict], int, Optional[int], bool, int]:
+        """Transfers in the range, newest first, within ``max_pages`` pages.
+
+        Returns the rows, the newest and oldest timestamps seen, whether
+        ``min_timestamp`` was reached and how many pages were used.
+        """
+        parse = SOURCES[token][2]
+        rows, newest, oldest, reached, pages = [], min_timestamp, max_timestamp, True, 0
+        async for data, more in self._node_pages(address, token, min_timestamp, max_timestamp, max_pages, newest_first=True):
+            pages += 1
+            for tx in data:
+                timestamp = tx.get("block_timestamp", 0)
+                newest = max(newest, timestamp)
+                oldest = timestamp if oldest is None else min(oldest, timestamp)
+            rows.extend(parse(address, data))
+            reached = not more
+        return rows, newest, oldest, reached, pages
+
+    async def _node_transfers(self, address: str, token: str, min_timestamp: int, max_timestamp: Optional[int]) -> AsyncIterator[dict]:
+        parse = SOURCES[token][2]
+        async for data, _ in self._node_pages(address, token, min_timestamp, max_timestamp):
+            for row in parse(address, data):
+                yield row
+
+    async def export(
+        self,
+        address: str,
+        tokens: Sequence[str] = TOKENS,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> AsyncIterator[List[dict]]:
+        """Serialized transfers in ``[start, end)`` straight from the node, oldest first.
+
+        Yields batches of up to ``TX_SYNC_PAGE_SIZE`` rows. Each token is paged
+        separately and the streams are merged by block timestamp, so at most one
+        node page per token is held in memory however long the range is. Nothing
+        is stored.
+        """
+        min_timestamp = _epoch_ms(start) if start else 0
+        # TronGrid's max_timestamp is inclusive; `end` is not.
+        max_timestamp = _epoch_ms(end) - 1 if end else None
+        streams = [self._node_transfers(address, token, min_timestamp, max_timestamp) for token in tokens]
+        heads = []
+        try:
+            for i, stream in enumerate(streams):
+                row = await anext(stream, None)
+                if row is not None:
+                    heads.append((row["block_timestamp"], i, row))
+            heapq.heapify(heads)
+            batch = []
+            while heads:
+                _, i, row = heapq.heappop(heads)
+                batch.append(serialize_transfer(row))
+                if len(batch) >= TX_SYNC_PAGE_SIZE:
+                    yield batch
+                    batch = []
+                row = await anext(streams[i], None)
+                if row is not None:
+                    heapq.heappush(heads, (row["block_timestamp"], i, row))
+            if batch:
+                yield batch
+        finally:
+            for stream in streams:
+                await stream.aclose()
+
+    @staticmethod
+    async def _insert_ignore(db: AsyncSession, rows: List[dict]) -> int:
+        if not rows:
+            return 0
+        for row in rows:
+            row["block_timestamp"] = datetime.utcfromtimestamp(row["block_timestamp"] / 1000)
+        insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+        result = await db.execute(
+            insert(Transaction).values(rows).on_conflict_do_nothing(
+                index_elements=["address", "txid", "token"]
+            )
+        )
+        return max(result.rowcount or 0, 0)
+
+    @staticmethod
+    async def page(
+        db: AsyncSession,
+        address: str,
+        limit: int,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        token: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Tuple[List[Transaction], bool]:
+        """Newest-first page of stored transfers and whether more pages follow."""
+        query = (
+            select(Transaction)
+            .where(Transaction.address == address)
+            .order_by(Transaction.block_timestamp.desc(), Transaction.id.desc())
+            .limit(limit + 1)
+        )
+        if token:
+            query = query.where(Transaction.token == token)
+        if start:
+            query = query.where(Transaction.block_timestamp >= start)
+        if end:
+            query = query.where(Transaction.block_timestamp < end)
+        if cursor:
+            query = query.where(tuple_(Transaction.block_timestamp, Transaction.id) < tuple_(*cursor))
+
+        rows = (await db.execute(query)).scalars().all()
+        return rows[:limit], len(rows) > limit
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import select
+
+from balances import BalanceLookupError, BalanceService
+from cache import CACHE_URL, CacheUnavailable, SharedChannel, SharedLease, cache_backend
+from database import Wallet
+from tron_client import USDT_CONTRACT, AsyncTronNodePool
+from tx_history import TOKEN_DECIMALS, TransactionHistory
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WATCHER_ENABLED = os.getenv("WATCHER_ENABLED", "true").lower() in ("1", "true", "yes")
+# TRON produces a block every ~3 seconds.
+WATCHER_POLL_INTERVAL = float(os.getenv("WATCHER_POLL_INTERVAL", "3"))
+# Blocks scanned per poll while catching up after a stall.
+WATCHER_MAX_BLOCKS = int(os.getenv("WATCHER_MAX_BLOCKS", "20"))
+# Seconds between reloads of the wallet address set (picks up wallets added by other workers).
+WATCHER_RELOAD_INTERVAL = float(os.getenv("WATCHER_RELOAD_INTERVAL", "60"))
+WATCHER_QUEUE_SIZE = int(os.getenv("WATCHER_QUEUE_SIZE", "100"))
+# With CACHE_URL set, seconds another worker waits before taking over polling from one that stopped renewing.
+WATCHER_LEASE_TTL = float(os.getenv("WATCHER_LEASE_TTL", "15"))
+
+TRANSFER_SELECTOR = "a9059cbb"  # transfer(address,uint256)
+
+
+def parse_block_transfers(block: dict, usdt_contract: str = USDT_CONTRACT) -> Iterator[dict]:
+    """TRX and USDT transfers in a block fetched with ``visible=True``."""
+    from tronpy import keys
+
+    header = block.get("block_header", {}).get("raw_data", {})
+    for tx in block.get("transactions") or []:
+        if (tx.get("ret") or [{}])[0].get("contractRet", "SUCCESS") != "SUCCESS":
+            continue
+        contracts = tx.get("raw_data", {}).get("contract") or []
+        if not contracts:
+            continue
+        kind = contracts[0].get("type")
+        value = contracts[0].get("parameter", {}).get("value", {})
+
+        if kind == "TransferContract":
+            token, to_address, amount = "TRX", value.get("to_address"), int(value.get("amount", 0))
+        elif kind == "TriggerSmartContract" and value.get("contract_address") == usdt_contract:
+            data = value.get("data") or ""
+            if not data.startswith(TRANSFER_SELECTOR) or len(data) < 136:
+                continue
+            token = "USDT"
+            to_address = keys.to_base58check_address("41" + data[32:72])
+            amount = int(data[72:136], 16)
+        else:
+            continue
+
+        yield {
+            "txid": tx.get("txID"),
+            "token": token,
+            "from": value.get("owner_address"),
+            "to": to_address,
+            "amount": amount,
+            "block_number": header.get("number"),
+            "timestamp": header.get("timestamp"),
+        }
+
+
+class BlockWatcher:
+    """Follows new blocks once for the whole deployment and pushes matching transfers.
+
+    Every transfer in a block is matched against the in-memory set of wallet
+    addresses (plus any address a client is subscribed to). Matches invalidate the
+    cached balance and transaction history and are pushed to subscribers' queues.
+
+    With ``CACHE_URL`` set only the worker holding the ``block_watcher`` lease
+    polls the node. It publishes each block's transfers on a shared channel and
+    the other workers match them against their own subscribers; if it stops
+    renewing the lease another worker takes over from the last block it scanned.
+    Without ``CACHE_URL`` (or while the cache server is unreachable) every worker
+    polls for itself.
+    """
+
+    def __init__(
+        self,
+        tron: AsyncTronNodePool,
+        balances: BalanceService,
+        history: TransactionHistory,
+        session_factory,
+        poll_interval: float = WATCHER_POLL_INTERVAL,
+    ):
+        self.tron = tron
+        self.balances = balances
+        self.history = history
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.addresses: Set[str] = set()
+        self.last_block: Optional[int] = None
+        self.blocks_scanned = 0
+        self.events_sent = 0
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._relay_task: Optional[asyncio.Task] = None
+        self._reloaded_at = 0.0
+        self.lease = SharedLease("block_watcher", ttl=max(WATCHER_LEASE_TTL, 3 * poll_interval))
+        self.leader = False
+        self._channel = SharedChannel("block_transfers") if CACHE_URL else None
+        self._cursor = cache_backend("block_watcher", maxsize=1, ttl=86400)
+
+    # Address index
+
+    def watch(self, address: str):
+        self.addresses.add(address)
+
+    async def reload_addresses(self):
+        async with self.session_factory() as db:
+            result = await db.execute(select(Wallet.address).distinct())
+            self.addresses = set(result.scalars().all())
+        self._reloaded_at = asyncio.get_running_loop().time()
+
+    def is_watched(self, address: Optional[str]) -> bool:
+        return address in self.addresses or address in self._subscribers
+
+    # Subscriptions
+
+    def subscribe(self, addresses: List[str]) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=WATCHER_QUEUE_SIZE)
+        for address in addresses:
+            self._subscribers.setdefault(address, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, addresses: List[str]):
+        for address in addresses:
+            queues = self._subscribers.get(address)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[address]
+
+    def _publish(self, address: str, event: dict):
+        for queue in self._subscribers.get(address, ()):
+            if queue.full():
+                # A slow client loses its oldest event rather than stalling the watcher.
+                queue.get_nowait()
+            queue.put_nowait(event)
+            self.events_sent += 1
+
+    # Block loop
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if self._channel is not None and self._relay_task is None:
+            self._relay_task = asyncio.create_task(self._relay())
+
+    async def stop(self):
+        for task in (self._task, self._relay_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._relay_task = None
+        if self.leader:
+            await self.lease.release()
+            self.leader = False
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._lead():
+                    if asyncio.get_running_loop().time() - self._reloaded_at >= WATCHER_RELOAD_INTERVAL:
+                        await self.reload_addresses()
+                    await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Block watcher poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _lead(self) -> bool:
+        """Take or renew the polling lease; True while this worker should poll."""
+        leader = await self.lease.acquire()
+        if leader and not self.leader and self.lease.shared:
+            # Resume where the previous holder stopped instead of at the chain head.
+            try:
+                self.last_block = await self._cursor.get("last_block", self.last_block)
+            except CacheUnavailable as e:
+                logger.warning("Could not read the shared block cursor: %s", e)
+            logger.info("Block watcher took the polling lease at block %s", self.last_block)
+        self.leader = leader
+        return leader
+
+    async def poll(self):
+        """Scan the blocks produced since the last poll."""
+        latest = await self.tron.call(lambda client: client.get_latest_block_number(), method="get_latest_block_number")
+        if self.last_block is None:
+            self.last_block = latest - 1
+        # Fall behind by at most WATCHER_MAX_BLOCKS; older blocks are skipped after a long stall.
+        start = max(self.last_block + 1, latest - WATCHER_MAX_BLOCKS + 1)
+        for number in range(start, latest + 1):
+            if number != start and not await self._lead():
+                break
+            block = await self.tron.call(lambda client, n=number: client.get_block(n), method="get_block")
+            transfers = list(parse_block_transfers(block))
+            await self._scan(transfers)
+            if self._channel is not None and self.lease.shared and transfers:
+                # Amounts as strings: TRC20 amounts can exceed the 64-bit integers JSON encoders accept.
+                await self._channel.publish({
+                    "origin": self.lease.owner,
+                    "transfers": [{**transfer, "amount": str(transfer["amount"])} for transfer in transfers],
+                })
+            self.last_block = number
+            self.blocks_scanned += 1
+            if self.lease.shared:
+                try:
+                    await self._cursor.set("last_block", number)
+                except CacheUnavailable as e:
+                    logger.warning("Could not save the shared block cursor: %s", e)
+
+    async def _relay(self):
+        """Match transfers published by the polling worker against this worker's subscribers."""
+        async for message in self._channel.listen():
+            if message.get("origin") == self.lease.owner:
+                continue
+            try:
+                await self._scan(message["transfers"], subscribed_only=True)
+            except Exception:
+                logger.exception("Block watcher relay failed")
+
+    async def _scan(self, block_transfers: List[dict], subscribed_only: bool = False):
+        touched: Dict[str, List[dict]] = {}
+        for transfer in block_transfers:
+            for address, direction, sign in ((transfer["to"], "in", 1), (transfer["from"], "out", -1)):
+                if address in self._subscribers if subscribed_only else self.is_watched(address):
+                    touched.setdefault(address, []).append({
+                        "txid": transfer["txid"],
+                        "token": transfer["token"],
+                        "direction": direction,
+                        "delta": sign * int(transfer["amount"]) / TOKEN_DECIMALS,
+                        "block_number": transfer["block_number"],
+                        "timestamp": datetime.utcfromtimestamp(transfer["timestamp"] / 1000).isoformat(),
+                    })
+
+        for address, transfers in touched.items():
+            await self.balances.invalidate(address)
+            await self.history.invalidate(address)
+            if address in self._subscribers:
+                await self._push(address, transfers)
+
+    async def _push(self, address: str, transfers: List[dict]):
+        try:
+            balances = await self.balances.get(address)
+        except BalanceLookupError as e:
+            balances = e.balances
+        for transfer in transfers:
+            self._publish(address, {
+                "type": "transfer",
+                "address": address,
+                **transfer,
+                "balances": {"TRX": balances["TRX"], "USDT": balances["USDT"]},
+            })
+
+    def status(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "polling": self.leader,
+            "last_block": self.last_block,
+            "blocks_scanned": self.blocks_scanned,
+            "watched_addresses": len(self.addresses),
+            "subscribed_addresses": len(self._subscribers),
+            "events_sent": self.events_sent,
+        }